@@ -1,9 +1,15 @@
 from __future__ import print_function
-import os.path
 import json
+import threading
+from abc import ABC, abstractmethod
+import time
+from collections import OrderedDict
+import httplib2
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from google.auth.transport.requests import Request
 
 SCOPES = [
@@ -11,38 +17,162 @@ SCOPES = [
     'https://www.googleapis.com/auth/calendar.events'
 ]
 
+# 舊版單一帳號使用的檔案，只在啟動時搬移到資料庫用
 TOKEN_FILE = 'token.json'
 CREDENTIALS_FILE = 'credentials.json'
+HTTP_TIMEOUT = 30
+MAX_CACHED_USERS = 256   # 記憶體中最多保留幾個使用者的 credentials / 連線
+RECHECK_SECONDS = 30     # 快取的 credentials 超過這麼久就和資料庫比對一次（其他 worker 重新授權 / 解除授權時跟著更新）
 
-def get_credentials():
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-    
-    # 如果 token 過期，嘗試刷新
-    if creds and creds.expired and creds.refresh_token:
-        try:
-            print("[DEBUG] Token 已過期，正在刷新...")
-            creds.refresh(Request())
-            # 保存刷新後的 token
-            with open(TOKEN_FILE, 'w') as token:
-                token.write(creds.to_json())
-            print("[DEBUG] Token 刷新成功")
-        except Exception as e:
-            print(f"[ERROR] Token 刷新失敗: {e}")
+# discovery 文件只解析一次（使用套件內建的靜態版本，不用每次連網下載）
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+def get_discovery_doc(name, version):
+    with _discovery_lock:
+        if (name, version) not in _discovery_docs:
+            _discovery_docs[(name, version)] = json.loads(get_static_doc(name, version))
+        return _discovery_docs[(name, version)]
+
+class TokenStore(ABC):
+    """token 的存取介面，由 main.py 提供資料庫版本的實作"""
+
+    @abstractmethod
+    def load(self, user_id):
+        """回傳 token JSON 字串，沒有授權時回傳 None"""
+
+    @abstractmethod
+    def save(self, user_id, token_json):
+        """保存刷新後的 token JSON 字串"""
+
+class _UserCredentials:
+    def __init__(self, token_json):
+        self.token_json = token_json    # 目前 creds 對應的資料庫內容，用來判斷別的 worker 是否改過
+        self.creds = Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
+        self.checked_at = time.monotonic()
+        self.lock = threading.Lock()
+
+class CredentialsManager:
+    """
+    每個使用者的 credentials 只在記憶體保留一份（LRU），過期時在該使用者的 lock 內刷新一次並寫回資料庫；
+    httplib2 不是 thread-safe，所以每個執行緒各自持有連線 (AuthorizedHttp) 與 service 物件並重複使用。
+    invalidate 只影響目前的 process，所以快取命中時每 RECHECK_SECONDS 秒再讀一次資料庫，
+    token 和快取的不同（其他 worker 重新授權或刷新過）就換成新的，已被刪除就不再使用
+    """
+
+    def __init__(self, store=None, max_users=MAX_CACHED_USERS):
+        self.store = store
+        self.max_users = max_users
+        self._users = OrderedDict()     # user_id -> _UserCredentials
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _entry(self, user_id):
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None:
+                self._users.move_to_end(user_id)
+                if time.monotonic() - cached.checked_at < RECHECK_SECONDS:
+                    return cached
+
+        token_json = self.store.load(user_id) if self.store else None
+        with self._lock:
+            if not token_json:
+                # 已解除授權（可能是在別的 worker）
+                self._users.pop(user_id, None)
+                return None
+            entry = self._users.get(user_id)
+            if entry is not None and entry.token_json == token_json:
+                # 資料庫沒有變動，或另一個執行緒剛好先載入了同一份
+                entry.checked_at = time.monotonic()
+                return entry
+            if entry is not None and entry is not cached:
+                return entry    # 另一個執行緒已經換成新的，以先放進去的為準
+            entry = self._users[user_id] = _UserCredentials(token_json)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return entry
+
+    def invalidate(self, user_id):
+        """使用者重新授權或解除授權後呼叫，下次使用時重新從資料庫載入"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def get_credentials(self, user_id):
+        entry = self._entry(user_id)
+        if entry is None:
             return None
-    
-    return creds
 
-def get_gmail_service():
-    creds = get_credentials()
-    if creds and creds.valid:
-        return build('gmail', 'v1', credentials=creds)
-    return None
+        with entry.lock:
+            creds = entry.creds
+            # 如果 token 過期，嘗試刷新（同一個使用者同時間只會有一個請求在刷新）
+            if creds.expired and creds.refresh_token:
+                try:
+                    print(f"[DEBUG] 使用者 {user_id} 的 Token 已過期，正在刷新...")
+                    creds.refresh(Request())
+                    # 保存刷新後的 token（記下寫入的內容，下次比對時才不會當成別人改過）
+                    entry.token_json = creds.to_json()
+                    self.store.save(user_id, entry.token_json)
+                    print("[DEBUG] Token 刷新成功")
+                except Exception as e:
+                    print(f"[ERROR] Token 刷新失敗: {e}")
+                    return None
+            return creds
+
+    def _thread_cache(self):
+        cache = getattr(self._local, 'users', None)
+        if cache is None:
+            cache = self._local.users = OrderedDict()
+        return cache
+
+    def get_http(self, user_id):
+        """目前執行緒、該使用者專用的已授權連線，沒有有效 credentials 時回傳 None"""
+        creds = self.get_credentials(user_id)
+        if not (creds and creds.valid):
+            return None
+
+        cache = self._thread_cache()
+        cached = cache.get(user_id)
+        # credentials 物件換了（重新授權 / 被 LRU 淘汰後重新載入）就重建連線
+        if cached is None or cached['creds'] is not creds:
+            cached = cache[user_id] = {
+                'creds': creds,
+                'http': AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT)),
+                'services': {},
+            }
+        cache.move_to_end(user_id)
+        while len(cache) > self.max_users:
+            cache.popitem(last=False)
+        return cached['http']
+
+    def get_service(self, user_id, name, version):
+        http = self.get_http(user_id)
+        if http is None:
+            return None
+
+        services = self._thread_cache()[user_id]['services']
+        if (name, version) not in services:
+            services[(name, version)] = build_from_document(get_discovery_doc(name, version), http=http)
+        return services[(name, version)]
+
+manager = CredentialsManager()
+
+def configure(store):
+    manager.store = store
+
+def make_flow(client_config):
+    return InstalledAppFlow.from_client_config(
+        client_config,
+        scopes=SCOPES,
+        redirect_uri='urn:ietf:wg:oauth:2.0:oob'
+    )
+
+def get_credentials(user_id):
+    return manager.get_credentials(user_id)
 
-def get_calendar_service():
-    creds = get_credentials()
-    if creds and creds.valid:
-        return build('calendar', 'v3', credentials=creds)
-    return None
+def get_gmail_service(user_id):
+    return manager.get_service(user_id, 'gmail', 'v1')
 
+def get_calendar_service(user_id):
+    return manager.get_service(user_id, 'calendar', 'v3')
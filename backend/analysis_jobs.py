@@ -0,0 +1,350 @@
+"""
+智慧分析背景工作
+- 每個工作存在 analysis_jobs，每封郵件的判斷存在 analysis_job_items，隨時可以查進度與部分結果
+- 程序內的 asyncio.Queue + 固定數量的 worker（ANALYSIS_JOB_WORKERS），不需要外部 broker
+- 抓到的郵件清單存在工作裡，重跑時不再重新抓信；已完成的 LLM 判斷在判斷快取裡，
+  每封郵件的結果以 (job_id, message_id) upsert，所以中斷後重跑是冪等的
+- 啟動時與每分鐘檢查一次：排隊中或 heartbeat 過期的執行中工作重新排入；到時間的每日排程建立新工作；
+  結束超過 RETENTION_DAYS 天的工作連同每封結果一起刪除，過期的 LLM 判斷快取也在這時清掉
+- 工作與排程的參數不存 API Key，執行時才從個人資料取得
+- 資料庫存取都在執行緒裡做（asyncio.to_thread），不會卡住 event loop 上的其他請求
+實際的分析流程由 main.py 透過 configure() 提供
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, UniqueConstraint, or_
+from database import Base, SessionLocal
+import verdict_cache
+
+WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+CHECK_INTERVAL = 60                      # 秒，檢查排程與需要恢復的工作
+STALE_AFTER = timedelta(minutes=5)       # 執行中的工作超過這段時間沒有 heartbeat 就視為中斷
+HEARTBEAT_INTERVAL = 60                  # 秒，執行中的工作定期更新 heartbeat（LLM 呼叫可能很久沒有進度）
+RETENTION_DAYS = int(os.getenv("ANALYSIS_JOB_RETENTION_DAYS", "7"))
+CLEANUP_BATCH = 500
+TAIPEI = timezone(timedelta(hours=8))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    schedule_id = Column(Integer, nullable=True)
+    status = Column(String(10), default=QUEUED, index=True)
+    params_json = Column(Text)
+    emails_json = Column(Text(16777215), nullable=True)
+    result_json = Column(Text(16777215), nullable=True)
+    error = Column(Text, nullable=True)
+    total = Column(Integer, default=0)
+    done_count = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class AnalysisJobItem(Base):
+    __tablename__ = "analysis_job_items"
+    __table_args__ = (
+        UniqueConstraint("job_id", "message_id", name="uq_analysis_job_item"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(32), index=True)
+    message_id = Column(String(64))
+    kind = Column(String(10))       # matched / removed / conflict
+    data_json = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AnalysisSchedule(Base):
+    __tablename__ = "analysis_schedules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True)
+    run_at = Column(String(5))      # 台北時間 HH:MM
+    enabled = Column(Boolean, default=True)
+    params_json = Column(Text)
+    last_run_date = Column(String(10), nullable=True)
+
+
+def _item_message_id(kind, data):
+    return data['email']['id'] if kind in ('matched', 'conflict') else data['id']
+
+
+def _save_item(db, job_id, kind, data):
+    message_id = _item_message_id(kind, data)
+    item = db.query(AnalysisJobItem).filter_by(job_id=job_id, message_id=message_id).first()
+    if item is None:
+        item = AnalysisJobItem(job_id=job_id, message_id=message_id)
+        db.add(item)
+    item.kind = kind
+    item.data_json = json.dumps(data, ensure_ascii=False)
+    item.updated_at = datetime.utcnow()
+    db.flush()
+
+
+def job_status(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "done": job.done_count,
+        "error": job.error,
+        "scheduled": job.schedule_id is not None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def job_result(db, job):
+    """完成的工作回傳最終結果；還沒完成時用目前已存的每封結果組出部分結果"""
+    if job.status == DONE and job.result_json:
+        return {**json.loads(job.result_json), "complete": True}
+    result = {"matched": [], "removed": [], "pending": [], "summary": "", "complete": False}
+    for item in db.query(AnalysisJobItem).filter_by(job_id=job.id).order_by(AnalysisJobItem.id):
+        key = "pending" if item.kind == "conflict" else item.kind
+        result[key].append(json.loads(item.data_json))
+    return result
+
+
+class JobRunner:
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.pipeline = None      # async generator: pipeline(user_id, params, emails, db) -> (事件, 資料)
+        self._queue = asyncio.Queue()
+        self._queued = set()      # 已在本程序佇列中的 job id
+        self._running = set()     # 本程序正在執行的 job id，不會再被排入
+        self._tasks = []
+
+    def configure(self, pipeline):
+        self.pipeline = pipeline
+
+    def create_job(self, db, user_id, params, schedule_id=None, enqueue=True):
+        """enqueue=False 時由呼叫端自己在 event loop 上 enqueue（在其他執行緒建立工作時）"""
+        job = AnalysisJob(id=uuid.uuid4().hex, user_id=user_id, schedule_id=schedule_id,
+                          status=QUEUED, params_json=json.dumps(params, ensure_ascii=False))
+        db.add(job)
+        db.commit()
+        if enqueue:
+            self.enqueue(job.id)
+        return job
+
+    def enqueue(self, job_id):
+        if job_id not in self._queued and job_id not in self._running:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    def _claim(self, db, job_id):
+        """把工作改成執行中；多個 worker 程序同時搶時只有一個會成功"""
+        stale = datetime.utcnow() - STALE_AFTER
+        claimed = db.query(AnalysisJob).filter(
+            AnalysisJob.id == job_id,
+            or_(AnalysisJob.status == QUEUED,
+                (AnalysisJob.status == RUNNING) & or_(AnalysisJob.heartbeat_at == None, AnalysisJob.heartbeat_at < stale))
+        ).update({
+            AnalysisJob.status: RUNNING,
+            AnalysisJob.heartbeat_at: datetime.utcnow(),
+            AnalysisJob.attempts: AnalysisJob.attempts + 1,
+        }, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+
+    def _touch(self, job_id):
+        db = SessionLocal()
+        try:
+            db.query(AnalysisJob).filter(AnalysisJob.id == job_id, AnalysisJob.status == RUNNING).update(
+                {AnalysisJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _heartbeat(self, job_id):
+        """工作執行期間定期更新 heartbeat，沒有事件的長時間 LLM 呼叫不會被當成中斷"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await asyncio.to_thread(self._touch, job_id)
+            except Exception as e:
+                print(f"[ERROR] 背景分析工作 {job_id} 更新 heartbeat 失敗: {e}")
+
+    def _start(self, db, job_id):
+        """搶到工作時回傳 (user_id, params, emails, 已有結果的 message_id)，否則回傳 None"""
+        if not self._claim(db, job_id):
+            return None
+        job = db.get(AnalysisJob, job_id)
+        done = {message_id for (message_id,) in db.query(AnalysisJobItem.message_id).filter_by(job_id=job_id)}
+        print(f"[DEBUG] 開始背景分析工作 {job_id}（第 {job.attempts} 次）")
+        emails = json.loads(job.emails_json) if job.emails_json else None
+        return job.user_id, json.loads(job.params_json), emails, done
+
+    def _record(self, db, job_id, event, data, done):
+        """存一個 pipeline 事件；done 是已有結果的 message_id，完成數直接用它的大小，不用每次 count()"""
+        job = db.get(AnalysisJob, job_id)
+        if event == "emails":
+            job.emails_json = json.dumps(data, ensure_ascii=False)
+            job.total = len(data)
+        elif event in ("matched", "removed", "conflict", "existing"):
+            # existing（行事曆上已有）覆蓋同一封郵件原本的 matched
+            kind = "removed" if event == "existing" else event
+            _save_item(db, job_id, kind, data)
+            done.add(_item_message_id(kind, data))
+            if event != "conflict":
+                job.done_count = len(done)
+        elif event == "result":
+            job.result_json = json.dumps(data, ensure_ascii=False)
+        job.heartbeat_at = datetime.utcnow()
+        db.commit()
+
+    def _finish(self, db, job_id, status, error=None):
+        db.rollback()
+        job = db.get(AnalysisJob, job_id)
+        job.status = status
+        job.error = error
+        if status != QUEUED:
+            job.finished_at = datetime.utcnow()
+        db.commit()
+
+    async def run_job(self, job_id):
+        if job_id in self._running:
+            return
+        self._running.add(job_id)
+        heartbeat = None
+        db = SessionLocal()
+        try:
+            started = await asyncio.to_thread(self._start, db, job_id)
+            if started is None:
+                return
+            user_id, params, emails, done = started
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                async for event, data in self.pipeline(user_id, params, emails, db):
+                    await asyncio.to_thread(self._record, db, job_id, event, data, done)
+            except asyncio.CancelledError:
+                # 程序關閉：放回佇列狀態，下次啟動時接著跑
+                await asyncio.to_thread(self._finish, db, job_id, QUEUED)
+                raise
+            except Exception as e:
+                print(f"[ERROR] 背景分析工作 {job_id} 失敗: {e}")
+                await asyncio.to_thread(self._finish, db, job_id, FAILED, str(e))
+            else:
+                await asyncio.to_thread(self._finish, db, job_id, DONE)
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            self._running.discard(job_id)
+            await asyncio.to_thread(db.close)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self.run_job(job_id)
+            except Exception as e:
+                print(f"[ERROR] 背景分析工作 {job_id} 無法執行: {e}")
+
+    def recover(self):
+        """回傳要重新排入佇列的工作：排隊中與中斷的（在執行緒裡呼叫，由 event loop enqueue）"""
+        db = SessionLocal()
+        try:
+            stale = datetime.utcnow() - STALE_AFTER
+            jobs = db.query(AnalysisJob.id).filter(or_(
+                AnalysisJob.status == QUEUED,
+                (AnalysisJob.status == RUNNING) & or_(AnalysisJob.heartbeat_at == None, AnalysisJob.heartbeat_at < stale)
+            )).order_by(AnalysisJob.created_at).all()
+            # 本程序還在執行的工作（heartbeat 可能剛好延遲）不重複排入
+            jobs = [job_id for (job_id,) in jobs if job_id not in self._running]
+            if jobs:
+                print(f"[DEBUG] 恢復 {len(jobs)} 個背景分析工作")
+            return jobs
+        finally:
+            db.close()
+
+    def run_schedules(self, now=None):
+        """建立到時間的每日排程工作（每個排程每天一次），回傳要排入佇列的 job id"""
+        now = (now or datetime.now(TAIPEI)).astimezone(TAIPEI)
+        today, current = now.strftime("%Y-%m-%d"), now.strftime("%H:%M")
+        db = SessionLocal()
+        created = []
+        try:
+            due = db.query(AnalysisSchedule).filter(
+                AnalysisSchedule.enabled == True,
+                AnalysisSchedule.run_at <= current,
+                or_(AnalysisSchedule.last_run_date == None, AnalysisSchedule.last_run_date != today)
+            ).all()
+            for schedule in due:
+                # 先把今天標記為已執行，多個程序同時檢查時只有一個會建立工作
+                claimed = db.query(AnalysisSchedule).filter(
+                    AnalysisSchedule.id == schedule.id,
+                    or_(AnalysisSchedule.last_run_date == None, AnalysisSchedule.last_run_date != today)
+                ).update({AnalysisSchedule.last_run_date: today}, synchronize_session=False)
+                db.commit()
+                if claimed == 1:
+                    job = self.create_job(db, schedule.user_id, json.loads(schedule.params_json),
+                                          schedule_id=schedule.id, enqueue=False)
+                    created.append(job.id)
+                    print(f"[DEBUG] 每日排程建立分析工作 {job.id} (user {schedule.user_id})")
+            return created
+        finally:
+            db.close()
+
+    def cleanup(self, now=None):
+        """刪除已結束（完成或失敗）超過保留期限的工作與每封結果（以及過期的 LLM 判斷快取），回傳刪除的工作數"""
+        cutoff = (now or datetime.utcnow()) - timedelta(days=RETENTION_DAYS)
+        db = SessionLocal()
+        deleted = 0
+        try:
+            while True:
+                job_ids = [job_id for (job_id,) in db.query(AnalysisJob.id).filter(
+                    AnalysisJob.status.in_((DONE, FAILED)),
+                    AnalysisJob.finished_at < cutoff
+                ).limit(CLEANUP_BATCH).all()]
+                if not job_ids:
+                    break
+                db.query(AnalysisJobItem).filter(AnalysisJobItem.job_id.in_(job_ids)).delete(synchronize_session=False)
+                db.query(AnalysisJob).filter(AnalysisJob.id.in_(job_ids)).delete(synchronize_session=False)
+                db.commit()
+                deleted += len(job_ids)
+            if deleted:
+                print(f"[DEBUG] 刪除 {deleted} 個過期的背景分析工作")
+            evicted = verdict_cache.evict_expired(db, now)
+            if evicted:
+                print(f"[DEBUG] 刪除 {evicted} 筆過期的 LLM 判斷快取")
+            return deleted
+        finally:
+            db.close()
+
+    async def _check_loop(self):
+        while True:
+            try:
+                # 查資料庫在執行緒裡做，排入佇列（asyncio.Queue）回到 event loop
+                for job_id in await asyncio.to_thread(self.recover) + await asyncio.to_thread(self.run_schedules):
+                    self.enqueue(job_id)
+                await asyncio.to_thread(self.cleanup)
+            except Exception as e:
+                print(f"[ERROR] 背景工作檢查失敗: {e}")
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._check_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # 佇列換新的：下次 start 可能在另一個 event loop；沒跑完的工作留在資料庫，啟動時會恢復
+        self._queue = asyncio.Queue()
+        self._queued = set()
+
+
+runner = JobRunner()
@@ -0,0 +1,346 @@
+"""
+效能測試腳本（不需要 Google 帳號，全部打本機假伺服器 fake_google_api.py）
+使用方式：
+    python benchmarks.py gmail [郵件數量] [延遲ms]
+    python benchmarks.py calendar [事件數量] [延遲ms]
+    python benchmarks.py body [電子報大小KB]
+    python benchmarks.py dates [重複次數]
+    python benchmarks.py existing [事件數量] [查詢數量]
+    python benchmarks.py load [同時使用者數] [延遲ms]
+"""
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import tempfile
+import threading
+import functools
+import statistics
+import tracemalloc
+import httplib2
+from googleapiclient.discovery import build
+
+import gmail_fetch
+import gmail_body
+import date_extract
+import calendar_batch
+import calendar_index
+import event_match
+from fake_google_api import FakeGoogleState, make_mailbox, start_server
+
+
+# 指定 api_endpoint 時 discovery 的 servicePath 會被覆蓋掉，要自己補回來
+SERVICE_PATHS = {"gmail": "", "calendar": "calendar/v3/"}
+
+
+def build_fake_service(name, version, base_url):
+    """建立指向假伺服器的 googleapiclient service"""
+    return build(
+        name, version,
+        http=httplib2.Http(),
+        static_discovery=True,
+        client_options={"api_endpoint": base_url + SERVICE_PATHS.get(name, "")},
+    )
+
+
+def _timed(label, state, fn):
+    state.http_requests = state.api_calls = 0
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<12} {elapsed * 1000:8.1f} ms  HTTP 請求 {state.http_requests:4d}  API 呼叫 {state.api_calls:4d}")
+    return result, elapsed
+
+
+def bench_gmail(count=100, latency_ms=50):
+    """逐封 get vs batch get"""
+    server, state, base_url = start_server(FakeGoogleState(make_mailbox(count), latency=latency_ms / 1000))
+    service = build_fake_service("gmail", "v1", base_url)
+    batch_uri = base_url + "batch/gmail/v1"
+
+    def sequential():
+        results = service.users().messages().list(userId='me', maxResults=count).execute()
+        return [
+            service.users().messages().get(userId='me', id=m['id']).execute()
+            for m in results.get('messages', [])
+        ]
+
+    def batched():
+        return gmail_fetch.fetch_emails(service, max_results=count, batch_uri=batch_uri)
+
+    print(f"Gmail 讀取 {count} 封郵件，模擬延遲 {latency_ms} ms")
+    seq, seq_time = _timed("逐封 get", state, sequential)
+    bat, bat_time = _timed("batch get", state, batched)
+    assert [m['id'] for m in seq] == [e['id'] for e in bat]
+    print(f"加速 {seq_time / bat_time:.1f}x")
+    server.shutdown()
+
+
+def bench_calendar(count=30, latency_ms=50):
+    """逐一 insert vs batch insert"""
+    server, state, base_url = start_server(FakeGoogleState({}, latency=latency_ms / 1000))
+    service = build_fake_service("calendar", "v3", base_url)
+    batch_uri = base_url + "batch/calendar/v3"
+    bodies = {
+        i: calendar_batch.build_event_body(f"測試行程 {i}", "2024-12-27", f"{9 + i % 10:02d}:00")
+        for i in range(count)
+    }
+
+    def sequential():
+        return [
+            service.events().insert(calendarId='primary', body=body).execute()
+            for body in bodies.values()
+        ]
+
+    def batched():
+        return calendar_batch.insert_events(service, bodies, batch_uri=batch_uri)
+
+    print(f"Calendar 新增 {count} 個事件，模擬延遲 {latency_ms} ms")
+    _, seq_time = _timed("逐一 insert", state, sequential)
+    results, bat_time = _timed("batch insert", state, batched)
+    assert all(r["success"] for r in results.values())
+
+    # batch 內有事件被限流時，會逐一重試補上
+    state.fail_every = 7
+    results, _ = _timed("batch+限流", state, batched)
+    print(f"限流情境成功 {sum(r['success'] for r in results.values())}/{count}")
+    print(f"加速 {seq_time / bat_time:.1f}x")
+    server.shutdown()
+
+
+def bench_body(size_kb=2048):
+    """大型 HTML 電子報：整份解碼再轉文字 vs gmail_body 分段擷取（耗時與記憶體峰值）"""
+    row = "<tr><td style='padding:4px'>本週活動：社團迎新 12/27 下午2點半 &amp; 期末專題說明會</td></tr>\n"
+    html = "<html><body><table>" + row * (size_kb * 1024 // len(row.encode("utf-8"))) + "</table></body></html>"
+    data = base64.urlsafe_b64encode(html.encode("utf-8")).decode("ascii").rstrip("=")
+    msg = {"id": "newsletter", "payload": {
+        "mimeType": "text/html",
+        "headers": [{"name": "Content-Type", "value": "text/html; charset=UTF-8"}],
+        "body": {"size": len(html), "data": data},
+    }}
+
+    def naive():
+        raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)).decode("utf-8")
+        text = re.sub(r"<[^>]+>", " ", raw).replace("&amp;", "&")
+        return re.sub(r"\s+", " ", text)[:gmail_body.BODY_TOKEN_BUDGET * 2]
+
+    def streamed():
+        return gmail_body.extract_text(msg)
+
+    print(f"HTML 電子報 {len(html.encode('utf-8')) // 1024} KB，內文預算 {gmail_body.BODY_TOKEN_BUDGET} tokens")
+    for label, fn in (("整份解碼", naive), ("分段擷取", streamed)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        text = fn()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{label:<8} {elapsed * 1000:8.1f} ms  記憶體峰值 {peak / 1024:8.0f} KB  內文 {len(text)} 字")
+
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "date_corpus.json")
+
+
+def _legacy_extract(text):
+    """舊版 extract_date_from_email / extract_time_from_email 的 regex 部分（依序嘗試、每次重新編譯），當作比較基準"""
+    found = {}
+    for pattern in [r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})', r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', r'(\d{1,2})月(\d{1,2})日']:
+        match = re.search(pattern, text)
+        if match:
+            if '月' in pattern:
+                found['date'] = f"2024-{int(match.group(1)):02d}-{int(match.group(2)):02d}"
+            elif len(match.group(1)) == 4:
+                found['date'] = f"{match.group(1)}-{int(match.group(2)):02d}-{int(match.group(3)):02d}"
+            else:
+                found['date'] = f"{match.group(3)}-{int(match.group(1)):02d}-{int(match.group(2)):02d}"
+            break
+    for pattern in [r'(\d{1,2}):(\d{2})', r'(\d{1,2})點', r'上午(\d{1,2})[點:]', r'下午(\d{1,2})[點:]']:
+        match = re.search(pattern, text)
+        if match:
+            hour = int(match.group(1))
+            if '下午' in pattern and hour < 12:
+                hour += 12
+            minute = int(match.group(2)) if ':' in match.group(0) else 0
+            found['time'] = f"{hour:02d}:{minute:02d}"
+            break
+    return found
+
+
+def bench_dates(rounds=200):
+    """日期 / 時間擷取：標註資料的準確率與每封耗時（舊版 regex vs date_extract）"""
+    with open(CORPUS_FILE, encoding="utf-8") as f:
+        corpus = json.load(f)
+    emails = [{"subject": e["subject"], "snippet": e["body"], "date": e.get("sent", corpus["sent"])} for e in corpus["emails"]]
+    fields = ("date", "time", "end_date", "end_time")
+
+    def new(email):
+        return date_extract.extract_email(email)
+
+    def legacy(email):
+        return _legacy_extract(email["subject"] + " " + email["snippet"])
+
+    print(f"標註郵件 {len(emails)} 封，耗時為重複 {rounds} 次的平均")
+    for label, fn in (("舊版 regex", legacy), ("date_extract", new)):
+        results = [fn(email) for email in emails]
+        correct = {field: sum(r.get(field) == e.get(field) for r, e in zip(results, corpus["emails"])) for field in fields}
+        exact = sum(all(r.get(k) == e.get(k) for k in fields) for r, e in zip(results, corpus["emails"]))
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for email in emails:
+                fn(email)
+        per_email = (time.perf_counter() - started) / (rounds * len(emails)) * 1e6
+        accuracy = "  ".join(f"{field} {correct[field] / len(emails):5.1%}" for field in fields)
+        print(f"{label:<12} {accuracy}  全對 {exact / len(emails):5.1%}  {per_email:6.1f} µs/封")
+
+    # 高信心的結果可以不問 LLM，看看這部分有多準
+    confident = [(new(email), e) for email, e in zip(emails, corpus["emails"])]
+    confident = [(r, e) for r, e in confident if r["confidence"] >= 0.8]
+    if confident:
+        hits = sum(r["date"] == e.get("date") and r["time"] == e.get("time") for r, e in confident)
+        print(f"信心 >= 0.8 的 {len(confident)} 封中日期與時間都正確 {hits} 封")
+
+
+EVENT_WORDS = ["社團", "迎新", "茶會", "期末", "專題", "報告", "讀書會", "系學會", "講座", "工作坊", "實驗室",
+               "組會", "面試", "牙醫", "家教", "籃球", "練習", "聚餐", "Project", "Sync", "Review", "Demo"]
+
+
+def bench_existing(count=2000, queries=500, seed=7):
+    """行事曆重複比對：建索引時間、每個建議的查詢耗時與判斷結果（一半是已存在的活動、一半是新的）"""
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        day = calendar_index.date(2024, 12, 1) + calendar_index.timedelta(days=rng.randrange(60))
+        start = calendar_index.datetime.combine(day, calendar_index.time(rng.randrange(8, 21)), calendar_index.TAIPEI)
+        events.append({
+            "id": f"evt{i}",
+            "summary": " ".join(rng.sample(EVENT_WORDS, 3)),
+            "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": (start + calendar_index.timedelta(hours=1)).isoformat()},
+        })
+
+    cases = []
+    for _ in range(queries // 2):
+        event = rng.choice(events)
+        start = calendar_index.datetime.fromisoformat(event["start"]["dateTime"])
+        # 郵件主旨通常比行事曆標題多一些字
+        cases.append((f"【提醒】{event['summary']} {start:%m/%d} 地點另行通知", start, True))
+        start = start.replace(hour=rng.randrange(8, 21))
+        cases.append((" ".join(rng.sample(EVENT_WORDS, 2)) + " 說明會", start, False))
+
+    started = time.perf_counter()
+    index = event_match.EventMatchIndex(events)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    found = [index.find(title, start, start + calendar_index.DEFAULT_EVENT_DURATION)[0] for title, start, _ in cases]
+    per_query = (time.perf_counter() - started) / len(cases) * 1e6
+    hits = sum(bool(event) for event, (_, _, exists) in zip(found, cases) if exists)
+    false_hits = sum(bool(event) for event, (_, _, exists) in zip(found, cases) if not exists)
+    print(f"事件 {len(index)} 個，建索引 {build_ms:.1f} ms，查詢 {len(cases)} 次，平均 {per_query:.1f} µs/次")
+    print(f"已存在的活動找到 {hits}/{len(cases) // 2}，新活動誤判為已存在 {false_hits}/{len(cases) // 2}")
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+async def _blocking_run(fn, *args, **kwargs):
+    """改版前的行為：Google 呼叫直接在 event loop 上執行"""
+    return fn(*args, **kwargs)
+
+
+def bench_load(users=10, latency_ms=50):
+    """
+    同時 users 個智慧分析請求（讀信 + 行事曆檢查，不呼叫 LLM），期間每 10 ms 打一次 /api/users/me 量回應時間；
+    比較 Google 呼叫直接在 event loop 上執行（改版前）與走 google_async 執行緒池。
+    每個請求會佔用一條資料庫連線，users 不要超過 SQLAlchemy 連線池的上限（預設 15）
+    """
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/benchmark_load.db")
+    import httpx
+    import Oauth
+    import google_async
+    import main
+
+    server, state, base_url = start_server(FakeGoogleState(make_mailbox(60), latency=latency_ms / 1000))
+    local = threading.local()
+
+    def service_getter(name, version):
+        # 和 Oauth.manager 一樣每個執行緒各自一個 service（httplib2 不是 thread-safe）
+        def get(user_id):
+            services = local.__dict__.setdefault("services", {})
+            if name not in services:
+                services[name] = build_fake_service(name, version, base_url)
+            return services[name]
+        return get
+
+    Oauth.get_gmail_service = service_getter("gmail", "v1")
+    Oauth.get_calendar_service = service_getter("calendar", "v3")
+    gmail_fetch.fetch_emails = functools.partial(gmail_fetch.fetch_emails, batch_uri=base_url + "batch/gmail/v1")
+    body = {"intent": "recent", "email_count": 30, "add_keywords": ["Meeting", "迎新"], "remove_keywords": [],
+            "custom_prompt": "", "api_key": "", "model_type": "gemini"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            login = await client.post("/api/auth/login", data={"username": "admin", "password": "secret"})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+            async def analyse():
+                started = time.perf_counter()
+                response = await client.post("/api/smart-analysis", json=body, headers=headers)
+                assert response.status_code == 200, response.text
+                return time.perf_counter() - started
+
+            async def probe(done):
+                latencies = []
+                while not done.is_set():
+                    started = time.perf_counter()
+                    await client.get("/api/users/me", headers=headers)
+                    latencies.append(time.perf_counter() - started)
+                    await asyncio.sleep(0.01)
+                return latencies
+
+            done = asyncio.Event()
+            prober = asyncio.create_task(probe(done))
+            started = time.perf_counter()
+            durations = await asyncio.gather(*(analyse() for _ in range(users)))
+            wall = time.perf_counter() - started
+            done.set()
+            return durations, await prober, wall
+
+    print(f"{users} 個使用者同時智慧分析，模擬 Google 延遲 {latency_ms} ms")
+    for label, run in (("loop 上直接呼叫", _blocking_run), ("google_async", None)):
+        if run:
+            google_async.executor.run = run
+        else:
+            del google_async.executor.run
+        durations, probes, wall = asyncio.run(scenario())
+        print(f"{label:<14} 總耗時 {wall * 1000:7.0f} ms  分析 p50 {statistics.median(durations) * 1000:6.0f} ms"
+              f" p95 {_percentile(durations, 0.95) * 1000:6.0f} ms  |  其他請求 p50 {statistics.median(probes) * 1000:5.1f} ms"
+              f" 最慢 {max(probes) * 1000:6.0f} ms ({len(probes)} 次)")
+    google_async.executor.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+    elif sys.argv[1] == "gmail":
+        bench_gmail(*(int(a) for a in sys.argv[2:4]))
+    elif sys.argv[1] == "calendar":
+        bench_calendar(*(int(a) for a in sys.argv[2:4]))
+    elif sys.argv[1] == "body":
+        bench_body(*(int(a) for a in sys.argv[2:3]))
+    elif sys.argv[1] == "dates":
+        bench_dates(*(int(a) for a in sys.argv[2:3]))
+    elif sys.argv[1] == "existing":
+        bench_existing(*(int(a) for a in sys.argv[2:4]))
+    elif sys.argv[1] == "load":
+        bench_load(*(int(a) for a in sys.argv[2:4]))
+    else:
+        print(f"未知的測試項目: {sys.argv[1]}")
@@ -0,0 +1,106 @@
+"""
+行事曆批次新增
+把多個 events().insert 打包成 Calendar batch request（每批最多 50 個），
+每個事件各自回報成功或失敗，batch 內因限流 / 伺服器錯誤 / 連線錯誤失敗的事件再逐一重試。
+每個事件送出前先指定 id（base32hex），重試時 Google 已經建立過的事件會回 409，當成成功，不會重複新增
+"""
+import uuid
+from datetime import datetime, timedelta
+from google_batch import new_batch, http_status, is_retryable
+
+BATCH_SIZE = 50      # Calendar batch 上限
+RETRY_NUM = 3        # 逐一重試時交給 googleapiclient 的重試次數（429/5xx 會自動退避）
+
+
+def new_event_id():
+    """Calendar 事件 id 只能用 base32hex 字元 (a-v, 0-9)，uuid 的 hex 字串符合"""
+    return uuid.uuid4().hex
+
+
+def build_event_body(title, date, time=None, is_all_day=False, description=""):
+    """組出 Calendar API 的 event body，有時間的事件預設長度 1 小時"""
+    # 判斷是否為全天事件
+    if is_all_day or not time:
+        return {
+            'summary': title,
+            'description': description,
+            'start': {
+                'date': date,
+            },
+            'end': {
+                'date': date,
+            }
+        }
+
+    # 有時間的事件
+    start_datetime = f"{date}T{time}:00"
+
+    # 計算結束時間（+1小時）
+    start_dt = datetime.fromisoformat(start_datetime)
+    end_dt = start_dt + timedelta(hours=1)
+
+    return {
+        'summary': title,
+        'description': description,
+        'start': {
+            'dateTime': start_datetime,
+            'timeZone': 'Asia/Taipei',
+        },
+        'end': {
+            'dateTime': end_dt.isoformat(),
+            'timeZone': 'Asia/Taipei',
+        }
+    }
+
+
+def insert_events(service, bodies, batch_size=BATCH_SIZE, batch_uri=None):
+    """
+    bodies: {index: event body}；沒有 id 的事件會先指定一個
+    回傳 {index: {"success": bool, "event_id": str|None, "error": str|None}}
+    """
+    bodies = {index: dict(body, id=body.get('id') or new_event_id()) for index, body in bodies.items()}
+    results = {}
+    failed = []
+
+    def record(index, response, exception):
+        """回傳 True 表示這個事件要重試"""
+        if exception is None:
+            results[index] = {"success": True, "event_id": response.get('id'), "error": None}
+        elif http_status(exception) == 409:
+            # 同一個 id 已經存在：之前的請求其實成功了
+            results[index] = {"success": True, "event_id": bodies[index]['id'], "error": None}
+        else:
+            results[index] = {"success": False, "event_id": None, "error": str(exception)}
+            # 連線 / 逾時錯誤也重試：Google 可能已經建立了事件，靠固定的 id 避免重複
+            return is_retryable(exception, transport_errors=True)
+        return False
+
+    def callback(request_id, response, exception):
+        index = int(request_id)
+        if record(index, response, exception):
+            failed.append(index)
+
+    indexes = list(bodies)
+    for start in range(0, len(indexes), batch_size):
+        batch = new_batch(service, callback, batch_uri)
+        for index in indexes[start:start + batch_size]:
+            batch.add(service.events().insert(calendarId='primary', body=bodies[index]), request_id=str(index))
+        try:
+            batch.execute()
+        except Exception as e:
+            # 整個 batch 失敗（例如網路錯誤），這批沒有結果的全部改逐一重試（id 固定，已建立的會回 409）
+            print(f"[ERROR] Calendar batch 失敗: {e}")
+            for index in indexes[start:start + batch_size]:
+                if index not in results:
+                    failed.append(index)
+
+    if failed:
+        print(f"[DEBUG] {len(failed)} 個事件在 batch 中失敗，逐一重試")
+    for index in failed:
+        try:
+            response = service.events().insert(calendarId='primary', body=bodies[index]).execute(num_retries=RETRY_NUM)
+            record(index, response, None)
+        except Exception as e:
+            record(index, None, e)
+
+    return results
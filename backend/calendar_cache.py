@@ -0,0 +1,224 @@
+"""
+行事曆月份快取
+每個月份的事件存在資料庫（跨 worker / 重啟保留）並在程序內用 LRU 保留最近用過的月份。
+快取過了 FRESH_SECONDS 之後用 Calendar API 的 syncToken 增量更新，只會傳回有變動的事件；
+新增 / 刪除行程時把對應月份標記為 dirty，下次讀取立刻更新
+get_month 在 google_async 的執行緒池執行、invalidate 在 event loop 上執行：
+LRU 本身與 dirty 標記由 _lock 保護，同一個月份的讀取 / 更新用分段鎖 (_stripes) 排隊，不會同時改同一筆快取
+"""
+import json
+import threading
+import time as time_module
+from collections import OrderedDict
+from datetime import datetime
+from googleapiclient.errors import HttpError
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, UniqueConstraint
+from database import Base
+from calendar_index import parse_event_time, TAIPEI
+
+FRESH_SECONDS = 30      # 這段時間內重複讀取同一個月份不打 API
+LRU_SIZE = 32
+PAGE_SIZE = 250
+
+
+class CalendarMonthCache(Base):
+    __tablename__ = "calendar_month_cache"
+    __table_args__ = (
+        UniqueConstraint("account", "year", "month", name="uq_calendar_month"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    account = Column(String(100), index=True)
+    year = Column(Integer)
+    month = Column(Integer)
+    sync_token = Column(Text, nullable=True)
+    events_json = Column(Text(16777215))
+    dirty = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# (account, year, month) -> {"sync_token", "events": {id: event}, "refreshed_at", "dirty"}
+_lru = OrderedDict()
+_lock = threading.Lock()
+_stripes = [threading.Lock() for _ in range(64)]
+
+
+def _month_lock(key):
+    return _stripes[hash(key) % len(_stripes)]
+
+
+def month_window(year, month):
+    """與原本 sync-tasks 相同：以 UTC 計算該月第一天到下個月第一天"""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start.isoformat() + 'Z', end.isoformat() + 'Z'
+
+
+def to_calendar_item(event):
+    start = event['start'].get('dateTime', event['start'].get('date'))
+    end = event['end'].get('dateTime', event['end'].get('date'))
+    return {
+        "id": event.get('id'),
+        "summary": event.get('summary', '(無標題)'),
+        "start": start,
+        "end": end,
+        "description": event.get('description', '')
+    }
+
+
+def _in_window(event, time_min, time_max):
+    try:
+        start = parse_event_time(event['start'])
+        end = parse_event_time(event['end'])
+    except (KeyError, ValueError):
+        return False
+    return start < datetime.fromisoformat(time_max) and end > datetime.fromisoformat(time_min)
+
+
+def _list_all(service, **kwargs):
+    """翻完所有頁，回傳 (items, nextSyncToken)"""
+    items = []
+    page_token = None
+    while True:
+        params = dict(kwargs, calendarId='primary', maxResults=PAGE_SIZE, singleEvents=True)
+        if page_token:
+            params['pageToken'] = page_token
+        result = service.events().list(**params).execute()
+        items.extend(result.get('items', []))
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return items, result.get('nextSyncToken')
+
+
+def _full_load(service, year, month):
+    time_min, time_max = month_window(year, month)
+    # 要拿 syncToken 不能帶 orderBy，改在本機排序
+    items, sync_token = _list_all(service, timeMin=time_min, timeMax=time_max)
+    events = {item['id']: to_calendar_item(item) for item in items if item.get('status') != 'cancelled'}
+    print(f"[DEBUG] 行事曆 {year}-{month:02d} 完整讀取 {len(events)} 筆")
+    return {"sync_token": sync_token, "events": events}
+
+
+def _incremental(service, entry, year, month):
+    time_min, time_max = month_window(year, month)
+    items, sync_token = _list_all(service, syncToken=entry["sync_token"])
+    for item in items:
+        if item.get('status') == 'cancelled' or not _in_window(item, time_min, time_max):
+            entry["events"].pop(item['id'], None)
+        else:
+            entry["events"][item['id']] = to_calendar_item(item)
+    entry["sync_token"] = sync_token or entry["sync_token"]
+    print(f"[DEBUG] 行事曆 {year}-{month:02d} 增量更新 {len(items)} 筆變動")
+    return len(items) > 0
+
+
+def _lru_put(key, entry):
+    with _lock:
+        _lru[key] = entry
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _save(db, account, year, month, entry):
+    row = db.query(CalendarMonthCache).filter_by(account=account, year=year, month=month).first()
+    if not row:
+        row = CalendarMonthCache(account=account, year=year, month=month)
+        db.add(row)
+    row.sync_token = entry["sync_token"]
+    row.events_json = json.dumps(list(entry["events"].values()), ensure_ascii=False)
+    row.dirty = False
+    row.updated_at = datetime.utcnow()
+    db.commit()
+
+
+def _sort_key(item):
+    value = item.get('start') or ''
+    try:
+        return parse_event_time({'dateTime': value} if 'T' in value else {'date': value})
+    except ValueError:
+        return datetime.min.replace(tzinfo=TAIPEI)
+
+
+def get_month(db, service, account, year, month):
+    """回傳該月份的事件列表（依開始時間排序）"""
+    key = (account, year, month)
+    with _month_lock(key):
+        return _get_month(db, service, account, year, month, key)
+
+
+def _get_month(db, service, account, year, month, key):
+    with _lock:
+        entry = _lru.get(key)
+
+    if entry is None:
+        row = db.query(CalendarMonthCache).filter_by(account=account, year=year, month=month).first()
+        if row and row.sync_token:
+            entry = {
+                "sync_token": row.sync_token,
+                "events": {item['id']: item for item in json.loads(row.events_json or "[]")},
+                "refreshed_at": 0,          # 從資料庫載入的一律先增量更新一次
+                "dirty": bool(row.dirty),
+            }
+
+    if entry is None:
+        entry = _full_load(service, year, month)
+        entry["dirty"] = False
+        _save(db, account, year, month, entry)
+    elif entry["dirty"] or time_module.monotonic() - entry["refreshed_at"] > FRESH_SECONDS:
+        # 更新前先清掉 dirty；更新期間又被 invalidate 標記的話保留到下次讀取
+        with _lock:
+            was_dirty, entry["dirty"] = entry["dirty"], False
+        try:
+            changed = _incremental(service, entry, year, month)
+            if changed or was_dirty:
+                _save(db, account, year, month, entry)
+        except Exception as e:
+            if not (isinstance(e, HttpError) and e.resp.status == 410):
+                with _lock:
+                    entry["dirty"] = entry["dirty"] or was_dirty
+                raise
+            print(f"[DEBUG] 行事曆 {year}-{month:02d} syncToken 已失效，重新完整讀取")
+            entry = _full_load(service, year, month)
+            entry["dirty"] = False
+            _save(db, account, year, month, entry)
+
+    entry["refreshed_at"] = time_module.monotonic()
+    _lru_put(key, entry)
+    return sorted(entry["events"].values(), key=_sort_key)
+
+
+def invalidate(db, account, months=None):
+    """標記月份需要更新；months 為 [(year, month)]，不指定則標記該帳號所有月份"""
+    with _lock:
+        for key, entry in _lru.items():
+            if key[0] == account and (months is None or key[1:] in months):
+                entry["dirty"] = True
+
+    try:
+        for row in db.query(CalendarMonthCache).filter(CalendarMonthCache.account == account):
+            if months is None or (row.year, row.month) in months:
+                row.dirty = True
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] 行事曆快取標記失敗: {e}")
+
+
+def months_of(dates):
+    """把 YYYY-MM-DD 字串轉成 {(year, month)}"""
+    months = set()
+    for value in dates:
+        try:
+            months.add((int(value[:4]), int(value[5:7])))
+        except (TypeError, ValueError):
+            continue
+    return months
+
+
+def reset(db, account):
+    with _lock:
+        for key in [key for key in _lru if key[0] == account]:
+            del _lru[key]
+    db.query(CalendarMonthCache).filter(CalendarMonthCache.account == account).delete(synchronize_session=False)
+    db.commit()
@@ -0,0 +1,117 @@
+"""
+行事曆衝突檢查
+一次查出整段日期範圍內的事件（自動翻頁），建成「日期 -> 依開始時間排序的區間」索引，
+之後每個建議行程只要在記憶體裡做區間重疊判斷（同一份事件也拿來建 event_match 的重複比對索引）
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, date, time, timedelta, timezone
+
+TAIPEI = timezone(timedelta(hours=8))
+DEFAULT_EVENT_DURATION = timedelta(hours=1)  # 與加入行事曆時的預設長度一致
+PAGE_SIZE = 250
+
+
+def list_events(service, time_min, time_max):
+    """查詢時間範圍內的所有事件（含翻頁）"""
+    events = []
+    page_token = None
+    while True:
+        kwargs = {
+            'calendarId': 'primary',
+            'timeMin': time_min.isoformat(),
+            'timeMax': time_max.isoformat(),
+            'maxResults': PAGE_SIZE,
+            'singleEvents': True,
+            'orderBy': 'startTime',
+        }
+        if page_token:
+            kwargs['pageToken'] = page_token
+        result = service.events().list(**kwargs).execute()
+        events.extend(result.get('items', []))
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return events
+
+
+def parse_event_time(value):
+    """Calendar 的 start/end 欄位轉成有時區的 datetime（全天事件視為當天 00:00）"""
+    if 'dateTime' in value:
+        dt = datetime.fromisoformat(value['dateTime'])
+        return dt if dt.tzinfo else dt.replace(tzinfo=TAIPEI)
+    return datetime.combine(date.fromisoformat(value['date']), time(), TAIPEI)
+
+
+def suggestion_interval(date_str, time_str=None):
+    """建議行程的時間區間；沒有時間就是整天"""
+    day = date.fromisoformat(date_str)
+    if time_str:
+        hour, minute = (int(x) for x in time_str.split(':')[:2])
+        start = datetime.combine(day, time(hour, minute), TAIPEI)
+        return start, start + DEFAULT_EVENT_DURATION
+    start = datetime.combine(day, time(), TAIPEI)
+    return start, start + timedelta(days=1)
+
+
+def window_events(service, date_strs, padding_days=0):
+    """查一次最早到最晚的建議日期（前後各多 padding_days 天）之間的所有事件"""
+    days = []
+    for date_str in date_strs:
+        try:
+            days.append(date.fromisoformat(date_str))
+        except (TypeError, ValueError):
+            continue
+    if not days:
+        return []
+    padding = timedelta(days=padding_days)
+    time_min = datetime.combine(min(days) - padding, time(), TAIPEI)
+    time_max = datetime.combine(max(days) + padding, time(), TAIPEI) + timedelta(days=1)
+    return list_events(service, time_min, time_max)
+
+
+class CalendarIndex:
+    def __init__(self, events):
+        self._days = defaultdict(list)   # date -> [(start, end, event)]
+        for event in events:
+            # 已取消或標記為「有空」的事件不算衝突
+            if event.get('status') == 'cancelled' or event.get('transparency') == 'transparent':
+                continue
+            try:
+                start = parse_event_time(event['start'])
+                end = parse_event_time(event['end'])
+            except (KeyError, ValueError):
+                continue
+            if end <= start:
+                end = start + timedelta(minutes=1)
+            self._add(start, end, event)
+
+        self._starts = {}
+        for day, segments in self._days.items():
+            segments.sort(key=lambda seg: seg[0])
+            self._starts[day] = [seg[0] for seg in segments]
+
+    def _add(self, start, end, event):
+        # 跨日事件切成每天一段
+        day = start.astimezone(TAIPEI).date()
+        while True:
+            day_start = datetime.combine(day, time(), TAIPEI)
+            day_end = day_start + timedelta(days=1)
+            self._days[day].append((max(start, day_start), min(end, day_end), event))
+            if end <= day_end:
+                return
+            day += timedelta(days=1)
+
+    def overlaps(self, start, end):
+        """回傳與 [start, end) 有時間重疊的事件"""
+        found = {}
+        day = start.astimezone(TAIPEI).date()
+        last_day = (end - timedelta(microseconds=1)).astimezone(TAIPEI).date()
+        while day <= last_day:
+            segments = self._days.get(day)
+            if segments:
+                # 開始時間 >= end 的區間一定不重疊
+                for seg_start, seg_end, event in segments[:bisect_left(self._starts[day], end)]:
+                    if seg_end > start:
+                        found.setdefault(event.get('id') or id(event), event)
+            day += timedelta(days=1)
+        return list(found.values())
@@ -0,0 +1,146 @@
+"""
+串流對話
+用各家的 async streaming API 逐段取得回覆，包成 server-sent events 送給前端；
+前端斷線時 StreamingResponse 會取消產生器，這裡在 finally 關閉上游的串流，上游請求跟著中止。
+fan_out_events() 同時詢問多個模型，各模型的片段交錯送出，每個模型完成時送出結果、耗時與 token 數
+"""
+import asyncio
+import json
+import time
+import client_pool
+
+PROVIDERS = ("openai", "gemini")
+MULTI_TIMEOUT = 60       # 多模型比較時每個模型的時間上限（秒）
+MAX_TARGETS = 8
+
+
+async def _stream_openai(client, model, prompt):
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    async with stream:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield {"type": "delta", "text": chunk.choices[0].delta.content}
+            if chunk.usage:
+                yield {
+                    "type": "usage",
+                    "prompt_tokens": chunk.usage.prompt_tokens,
+                    "completion_tokens": chunk.usage.completion_tokens,
+                }
+
+
+async def _stream_gemini(client, model, prompt):
+    stream = await client.aio.models.generate_content_stream(model=model, contents=prompt)
+    usage = None
+    try:
+        async for chunk in stream:
+            if chunk.text:
+                yield {"type": "delta", "text": chunk.text}
+            if chunk.usage_metadata:
+                usage = chunk.usage_metadata
+    finally:
+        await stream.aclose()
+    if usage:
+        # usage_metadata 是累計值，以最後一段為準
+        yield {
+            "type": "usage",
+            "prompt_tokens": usage.prompt_token_count,
+            "completion_tokens": usage.candidates_token_count,
+        }
+
+
+async def stream_chat(provider, api_key, model, prompt):
+    """依序產生 {"type": "delta", "text"} 與最後的 {"type": "usage", ...}；串流期間一直借用 client"""
+    async with client_pool.registry.use(provider, api_key) as client:
+        stream = _stream_openai(client, model, prompt) if provider == "openai" else _stream_gemini(client, model, prompt)
+        async for event in stream:
+            yield event
+
+
+async def complete_chat(provider, api_key, model, prompt):
+    """非串流版本：把串流內容接起來"""
+    parts = []
+    async for event in stream_chat(provider, api_key, model, prompt):
+        if event["type"] == "delta":
+            parts.append(event["text"])
+    return "".join(parts)
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_events(provider, api_key, model, prompt):
+    """delta 事件逐段送出，結束時送 done（含 token 數），錯誤時送 error"""
+    usage = {}
+    try:
+        async for event in stream_chat(provider, api_key, model, prompt):
+            if event["type"] == "delta":
+                yield sse("delta", {"text": event["text"]})
+            else:
+                usage = {k: v for k, v in event.items() if k != "type"}
+    except Exception as e:
+        print(f"{provider} Stream Error: {e}")
+        yield sse("error", {"error": str(e)})
+        return
+    yield sse("done", usage)
+
+
+async def _run_target(queue, index, provider, model, api_key, prompt, timeout):
+    started = time.perf_counter()
+    result = {"index": index, "provider": provider, "model": model}
+    parts = []
+
+    async def collect():
+        async for event in stream_chat(provider, api_key, model, prompt):
+            if event["type"] == "delta":
+                if not parts:
+                    result["first_token_ms"] = round((time.perf_counter() - started) * 1000)
+                parts.append(event["text"])
+                await queue.put(("delta", {"index": index, "text": event["text"]}))
+            else:
+                result.update({k: v for k, v in event.items() if k != "type"})
+
+    try:
+        if not api_key:
+            raise ValueError(f"缺少 {provider} API Key")
+        await asyncio.wait_for(collect(), timeout)
+        result["response"] = "".join(parts)
+    except asyncio.TimeoutError:
+        result["error"] = f"超過 {timeout} 秒未完成"
+        result["partial"] = "".join(parts)
+    except Exception as e:
+        print(f"{provider} ({model}) Error: {e}")
+        result["error"] = str(e)
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000)
+    await queue.put(("result", result))
+
+
+async def fan_out_events(targets, prompt, timeout=MULTI_TIMEOUT):
+    """
+    targets: [(provider, model, api_key)]，全部同時送出。
+    事件：delta {index, text}、每個模型完成時 result {index, response|error, latency_ms, token 數}、最後 done
+    """
+    started = time.perf_counter()
+    queue = asyncio.Queue()
+    tasks = [
+        asyncio.create_task(_run_target(queue, index, provider, model, api_key, prompt, timeout))
+        for index, (provider, model, api_key) in enumerate(targets)
+    ]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event, data = await queue.get()
+            if event == "result":
+                remaining -= 1
+            yield sse(event, data)
+        yield sse("done", {"latency_ms": round((time.perf_counter() - started) * 1000)})
+    finally:
+        # 前端斷線時把還在跑的模型全部取消
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
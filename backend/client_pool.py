@@ -0,0 +1,129 @@
+"""
+共用的非同步 client
+OpenAI / Gemini 的 client 依 (provider, api_key) 快取重複使用（LRU，閒置超過 IDLE_SECONDS 就關閉）。
+client 透過 `async with registry.use(provider, api_key)` 取得並計數，被淘汰時還有人在用就等最後一個用完才關閉；
+外部 HTTP 呼叫依名稱共用 httpx.AsyncClient，連線保持 keep-alive 不用每次重新 TLS 握手。
+registry 在 FastAPI lifespan 啟動時開始定期清理，關閉時釋放所有連線
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import httpx
+import openai
+from google import genai
+
+MAX_CLIENTS = int(os.getenv("LLM_CLIENT_POOL_SIZE", "64"))
+IDLE_SECONDS = int(os.getenv("LLM_CLIENT_IDLE_SECONDS", "600"))
+SWEEP_INTERVAL = 60
+
+
+def _create(provider, api_key):
+    if provider == "gemini":
+        return genai.Client(api_key=api_key)
+    if provider == "openai":
+        return openai.AsyncOpenAI(api_key=api_key)
+    raise ValueError(f"未知的 provider: {provider}")
+
+
+async def _close(provider, client):
+    try:
+        if provider == "gemini":
+            await client.aio.aclose()
+            client.close()
+        else:
+            await client.close()
+    except Exception as e:
+        print(f"[ERROR] 關閉 {provider} client 失敗: {e}")
+
+
+class _Entry:
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.users = 0          # 目前借出中的次數
+        self.evicted = False    # 已從 registry 移除，最後一個使用者歸還時關閉
+
+
+class ClientRegistry:
+    def __init__(self, max_clients=MAX_CLIENTS, idle_seconds=IDLE_SECONDS):
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self._clients = OrderedDict()   # (provider, api_key) -> _Entry
+        self._http = {}                 # name -> httpx.AsyncClient
+        self._pending_close = set()
+        self._sweeper = None
+
+    def _discard(self, key, client):
+        # 交給背景關閉，不阻塞目前的請求
+        try:
+            task = asyncio.get_running_loop().create_task(_close(key[0], client))
+        except RuntimeError:
+            return
+        self._pending_close.add(task)
+        task.add_done_callback(self._pending_close.discard)
+
+    def _evict(self, key, entry):
+        """從 registry 移除；還有請求在用的 client 等歸還時才關閉，否則會中斷進行中的請求"""
+        entry.evicted = True
+        if entry.users == 0:
+            self._discard(key, entry.client)
+
+    @asynccontextmanager
+    async def use(self, provider, api_key):
+        """借用 (provider, api_key) 對應的 client，離開 with 時歸還並更新閒置時間"""
+        key = (provider, api_key)
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = self._clients[key] = _Entry(_create(provider, api_key))
+            while len(self._clients) > self.max_clients:
+                self._evict(*self._clients.popitem(last=False))
+        self._clients.move_to_end(key)
+        entry.users += 1
+        try:
+            yield entry.client
+        finally:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            if entry.evicted and entry.users == 0:
+                self._discard(key, entry.client)
+
+    def http(self, name="default", **kwargs):
+        """依名稱共用的 httpx.AsyncClient；kwargs 只在第一次建立時使用"""
+        client = self._http.get(name)
+        if client is None or client.is_closed:
+            kwargs.setdefault("limits", httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60))
+            client = self._http[name] = httpx.AsyncClient(**kwargs)
+        return client
+
+    def sweep(self):
+        """關閉閒置太久的 LLM client（借出中的不算閒置）"""
+        cutoff = time.monotonic() - self.idle_seconds
+        for key in [key for key, entry in self._clients.items() if entry.users == 0 and entry.last_used < cutoff]:
+            self._evict(key, self._clients.pop(key))
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            self.sweep()
+
+    async def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def aclose(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        clients, self._clients = self._clients, OrderedDict()
+        for (provider, _), entry in clients.items():
+            await _close(provider, entry.client)
+        http_clients, self._http = self._http, {}
+        for client in http_clients.values():
+            await client.aclose()
+        if self._pending_close:
+            await asyncio.gather(*self._pending_close, return_exceptions=True)
+
+
+registry = ClientRegistry()
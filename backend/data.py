@@ -1,60 +1,69 @@
-restaurants_db = [
-    {"id": 4, "name": "一億園", "location": "宵夜街", "address": "桃園市中壢區五興路345號", "businesshours": "11:00-19:30 (週六日一休息)", "openingHours": [{"days": [2, 3, 4, 5], "slots": [{"start": "11:00", "end": "19:30"}]}]},
-    {"id": 5, "name": "麥味登", "location": "宵夜街", "address": "桃園市中壢區五興路343號", "businesshours": "8:00-14:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "08:00", "end": "14:00"}]}]},
-    {"id": 6, "name": "翔食堂", "location": "宵夜街", "address": "桃園市中壢區五興路339號", "businesshours": "10:00-13:30, 16:00-19:30 (週日公休)", "openingHours": [{"days": [1, 2, 3, 4, 5, 6], "slots": [{"start": "10:00", "end": "13:30"}, {"start": "16:00", "end": "19:30"}]}]},
-    {"id": 7, "name": "滿食記燒肉丼飯", "location": "宵夜街", "address": "桃園市中壢區五興路附近", "businesshours": "12:00-14:00, 17:00-20:00 (週日僅晚上營業、週六公休)", "openingHours": [{"days": [0], "slots": [{"start": "17:00", "end": "20:00"}]}, {"days": [1, 2, 3, 4, 5], "slots": [{"start": "12:00", "end": "14:00"}, {"start": "17:00", "end": "20:00"}]}]},
-    {"id": 8, "name": "來來炒飯", "location": "宵夜街", "address": "桃園市中壢區五興路337號", "businesshours": "11:30-14:00, 16:30-20:30 (週五公休)", "openingHours": [{"days": [0, 1, 2, 3, 4, 6], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "16:30", "end": "20:30"}]}]},
-    {"id": 9, "name": "東東生鮮手工大水餃", "location": "宵夜街", "address": "桃園市中壢區五興路", "businesshours": "11:30-14:00, 17:00-19:30", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "17:00", "end": "19:30"}]}]},
-    {"id": 10, "name": "夏克堤", "location": "宵夜街", "address": "桃園市中壢區五興路333號", "businesshours": "12:00-23:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "12:00", "end": "23:00"}]}]},
-    {"id": 11, "name": "中央餐車雞排", "location": "宵夜街", "address": "桃園市中壢區五興路416號", "businesshours": "17:00-00:00 (週日~周二公休)", "openingHours": [{"days": [3, 4, 5, 6], "slots": [{"start": "17:00", "end": "24:00"}]}]},
-    {"id": 12, "name": "立橙", "location": "宵夜街", "address": "桃園市中壢區五興路345號", "businesshours": "11:30-00:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "11:30", "end": "24:00"}]}]},
-    {"id": 13, "name": "大嗑蔬菜蛋餅", "location": "後門", "address": "桃園市中壢區中央路159號", "businesshours": "7:00-14:30(平日)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "07:00", "end": "14:30"}]}]},
-    {"id": 14, "name": "豪味堡", "location": "宵夜街", "address": "桃園市中壢區五興路418號", "businesshours": "6:00-13:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "06:00", "end": "13:00"}]}]},
-    {"id": 15, "name": "比三樂創意料理", "location": "宵夜街", "address": "桃園市中壢區五興路418號", "businesshours": "5:00-22:30", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "05:00", "end": "22:30"}]}]},
-    {"id": 16, "name": "一品鍋", "location": "宵夜街", "address": "桃園市中壢區五興路416號", "businesshours": "12:00-14:00, 17:00-21:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "12:00", "end": "14:00"}, {"start": "17:00", "end": "21:00"}]}]},
-    {"id": 17, "name": "MAIN蛋", "location": "宵夜街", "address": "桃園市中壢區五興路416號2樓", "businesshours": "20:00-2:00 (週末公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "20:00", "end": "02:00"}]}]},
-    {"id": 18, "name": "宵夜屋自助餐", "location": "宵夜街", "address": "桃園市中壢區五興路410號", "businesshours": "11:00-19:00 (週末公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "11:00", "end": "19:00"}]}]},
-    {"id": 19, "name": "田家牛肉麵", "location": "宵夜街", "address": "桃園市中壢區五興路408號", "businesshours": "11:00-14:00, 17:00-20:00 (假日公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "11:00", "end": "14:00"}, {"start": "17:00", "end": "20:00"}]}]},
-    {"id": 20, "name": "花路", "location": "後門", "address": "桃園市平鎮區中央路145-2號", "businesshours": "11:30-14:00, 17:30-20:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "17:30", "end": "20:00"}]}]},
-    {"id": 21, "name": "祐桑手工煎餃", "location": "宵夜街", "address": "桃園市中壢區五興路400號", "businesshours": "11:30-14:00, 17:00-00:00 (週六公休)", "openingHours": [{"days": [0, 1, 2, 3, 4, 5], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "17:00", "end": "24:00"}]}]},
-    {"id": 22, "name": "新福紅油抄手", "location": "後門", "address": "桃園市平鎮區中央路137號", "businesshours": "11:00-14:00, 17:00-21:00", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "11:00", "end": "14:00"}, {"start": "17:00", "end": "21:00"}]}]},
-    {"id": 23, "name": "小惡魔茶飲", "location": "宵夜街", "address": "桃園市中壢區五興路396號", "businesshours": "14:00-1:00 (週日公休)", "openingHours": [{"days": [1, 2, 3, 4, 5, 6], "slots": [{"start": "14:00", "end": "01:00"}]}]},
-    {"id": 24, "name": "惡魔爆漿炸蛋", "location": "宵夜街", "address": "桃園市中壢區五興路398號", "businesshours": "17:45-01:00 (週日公休)", "openingHours": [{"days": [1, 2, 3, 4, 5, 6], "slots": [{"start": "17:45", "end": "01:00"}]}]},
-    {"id": 26, "name": "樵夫關東煮", "location": "宵夜街", "address": "桃園市中壢區五興路390號", "businesshours": "11:30-13:30, 17:00-23:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "11:30", "end": "13:30"}, {"start": "17:00", "end": "23:00"}]}]},
-    {"id": 27, "name": "霸王香雞排", "location": "宵夜街", "address": "桃園市中壢區五興路390號", "businesshours": "17:00-01:30", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "17:00", "end": "01:30"}]}]},
-    {"id": 28, "name": "388飯麵食堂", "location": "宵夜街", "address": "桃園市中壢區武興路345號", "businesshours": "11:00-14:00, 16:30-20:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "11:00", "end": "14:00"}, {"start": "16:30", "end": "20:00"}]}]},
-    {"id": 29, "name": "香城燒臘小館", "location": "宵夜街", "address": "桃園市中壢區五興路331巷6號", "businesshours": "11:00-14:30, 16:30-19:30 (週末公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "11:00", "end": "14:30"}, {"start": "16:30", "end": "19:30"}]}]},
-    {"id": 31, "name": "熊讚啦啦", "location": "宵夜街", "address": "桃園市中壢區五興路331巷8號對面", "businesshours": "不定時", "openingHours": []},
-    {"id": 32, "name": "來客", "location": "宵夜街", "address": "桃園市中壢區五興路331巷28-2號", "businesshours": "11:30-14:00, 17:00-19:30 (週末公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "17:00", "end": "19:30"}]}]},
-    {"id": 33, "name": "茶繪", "location": "宵夜街", "address": "桃園市中壢區五興路331巷28-2號", "businesshours": "12:00-00:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "12:00", "end": "24:00"}]}]},
-    {"id": 34, "name": "阿米玲食堂", "location": "後門", "address": "桃園市中壢區中央路212號", "businesshours": "11:30-13:30, 17:00-19:30", "openingHours": [{"days": [1, 2, 3], "slots": [{"start": "11:30", "end": "13:30"}, {"start": "17:00", "end": "19:30"}]}]},
-    {"id": 35, "name": "曼尼廚房", "location": "宵夜街", "address": "桃園市中壢區五興路331巷32號", "businesshours": "11:30-14:00, 17:00-20:00 (週六公休)", "openingHours": [{"days": [0, 1, 2, 3, 4, 5], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "17:00", "end": "20:00"}]}]},
-    {"id": 36, "name": "咖哩老師", "location": "宵夜街", "address": "桃園市中壢區五興路331巷36號", "businesshours": "11:30-14:00, 16:30-19:30 (週五、日公休)", "openingHours": [{"days": [1, 2, 3, 4, 6], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "16:30", "end": "19:30"}]}]},
-    {"id": 37, "name": "外星人雞蛋糕", "location": "宵夜街", "address": "桃園市中壢區五興路331巷50號", "businesshours": "2:00-21:00 (週日公休)", "openingHours": [{"days": [1, 2, 3, 4, 5, 6], "slots": [{"start": "14:00", "end": "21:00"}]}]},
-    {"id": 38, "name": "無敵蛋餅", "location": "宵夜街", "address": "桃園市中壢區五興路331巷52號", "businesshours": "18:00-02:00 (週六公休)", "openingHours": [{"days": [0, 1, 2, 3, 4, 5], "slots": [{"start": "18:00", "end": "02:00"}]}]},
-    {"id": 39, "name": "楊滇風", "location": "宵夜街", "address": "桃園市中壢區五興路331巷58號", "businesshours": "11:30-14:00, 17:00-21:00 11:30-21:00(週一) 17:00-21:00(週三)", "openingHours": [{"days": [1], "slots": [{"start": "11:30", "end": "21:00"}]}, {"days": [3], "slots": [{"start": "17:00", "end": "21:00"}]}, {"days": [0, 2, 4, 5, 6], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "17:00", "end": "21:00"}]}]},
-    {"id": 40, "name": "比大爺滷味", "location": "宵夜街", "address": "桃園市中壢區五興路329號", "businesshours": "", "openingHours": []},
-    {"id": 41, "name": "雞叔叔", "location": "宵夜街", "address": "桃園市中壢區五興路329號之一", "businesshours": "17:30-00:30", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "17:30", "end": "00:30"}]}]},
-    {"id": 42, "name": "厚臉皮蛋餅", "location": "宵夜街", "address": "桃園市中壢區五興路329號之一", "businesshours": "17:00-24:00 (週末公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "17:00", "end": "24:00"}]}]},
-    {"id": 44, "name": "緣杏廣東粥飯麵", "location": "宵夜街", "address": "桃園市中壢區五興路331巷1號", "businesshours": "10:00-14:00, 16:00-21:00 (週日公休)", "openingHours": [{"days": [1, 2, 3, 4, 5, 6], "slots": [{"start": "10:00", "end": "14:00"}, {"start": "16:00", "end": "21:00"}]}]},
-    {"id": 45, "name": "瑞麟美而美", "location": "宵夜街", "address": "桃園市中壢區五興路331巷3號", "businesshours": "6:00-14:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "06:00", "end": "14:00"}]}]},
-    {"id": 46, "name": "喜樂廚房", "location": "宵夜街", "address": "桃園市中壢區五興路331巷9號", "businesshours": "", "openingHours": []},
-    {"id": 47, "name": "夠義式", "location": "宵夜街", "address": "桃園市中壢區五興路331巷", "businesshours": "11:30-13:30, 16:30-19:30 (周末公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "11:30", "end": "13:30"}, {"start": "16:30", "end": "19:30"}]}]},
-    {"id": 48, "name": "25食堂", "location": "宵夜街", "address": "桃園市中壢區五興路331巷25號", "businesshours": "16:30-20:30, 21:00-00:00 (週五、六公休)", "openingHours": [{"days": [0, 1, 2, 3, 4], "slots": [{"start": "16:30", "end": "20:30"}, {"start": "21:00", "end": "24:00"}]}]},
-    {"id": 49, "name": "香煎小舖", "location": "宵夜街", "address": "桃園市中壢區五興路331巷29號", "businesshours": "11:30-14:00, 17:00-20:30 (週五至日公休)", "openingHours": [{"days": [1, 2, 3, 4], "slots": [{"start": "11:30", "end": "14:00"}, {"start": "17:00", "end": "20:30"}]}]},
-    {"id": 50, "name": "協力集團香雞排", "location": "宵夜街", "address": "桃園市中壢區五興路331巷29號旁", "businesshours": "17:00-1:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "17:00", "end": "01:00"}]}]},
-    {"id": 51, "name": "立欣豆花店", "location": "宵夜街", "address": "桃園市中壢區五興路331巷6號", "businesshours": "中午-上午一點 (週末公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "12:00", "end": "01:00"}]}]},
-    {"id": 52, "name": "秘密基地", "location": "後門", "address": "桃園市中壢區中央路228號之1旁", "businesshours": "11:30-13:30, 17:00-20:00 (週一、週日公休)", "openingHours": [{"days": [2, 3, 4, 5, 6], "slots": [{"start": "11:30", "end": "13:30"}, {"start": "17:00", "end": "20:00"}]}]},
-    {"id": 53, "name": "川川滷味", "location": "後門", "address": "桃園市平鎮區中央路145-2號 前", "businesshours": "17:30-22:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "17:30", "end": "22:00"}]}]},
-    {"id": 55, "name": "樂活堡", "location": "後門", "address": "桃園市中壢區中央路208號", "businesshours": "7:00-14:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "07:00", "end": "14:00"}]}]},
-    {"id": 56, "name": "萊姆斯", "location": "後門", "address": "桃園市平鎮區中央路125號", "businesshours": "6:00-13:30", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "06:00", "end": "13:30"}]}]},
-    {"id": 57, "name": "惟克美而美", "location": "後門", "address": "桃園市平鎮區中央路127號", "businesshours": "5:30-14:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "05:30", "end": "14:00"}]}]},
-    {"id": 58, "name": "麥堡堡早點", "location": "後門", "address": "桃園市平鎮區中央路163號", "businesshours": "6:00-14:00 (週日公休)", "openingHours": [{"days": [1, 2, 3, 4, 5, 6], "slots": [{"start": "06:00", "end": "14:00"}]}]},
-    {"id": 59, "name": "馬爾波", "location": "後門", "address": "桃園市中壢區中央路216巷68號", "businesshours": "11:30-20:00 16:30-20:00(週二)", "openingHours": [{"days": [2], "slots": [{"start": "16:30", "end": "20:00"}]}, {"days": [0, 1, 3, 4, 5, 6], "slots": [{"start": "11:30", "end": "20:00"}]}]},
-    {"id": 60, "name": "sidewalk人行道蔬食", "location": "後門", "address": "桃園市中壢區中央路216巷39號", "businesshours": "11:00-14:30, 16:30-20:00 (周一公休)", "openingHours": [{"days": [0, 2, 3, 4, 5, 6], "slots": [{"start": "11:00", "end": "14:30"}, {"start": "16:30", "end": "20:00"}]}]},
-    {"id": 61, "name": "No.17White House", "location": "後門", "address": "桃園市中壢區中央路216巷21號", "businesshours": "11:30-13:30, 17:00-19:30 (假日公休)", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "11:30", "end": "13:30"}, {"start": "17:00", "end": "19:30"}]}]},
-    {"id": 62, "name": "熱浪島", "location": "後門", "address": "桃園市中壢區中央路216巷86弄58-1號", "businesshours": "11:00-14:00, 17:00-20:00 (週三、四公休)", "openingHours": [{"days": [0, 1, 2, 5, 6], "slots": [{"start": "11:00", "end": "14:00"}, {"start": "17:00", "end": "20:00"}]}]},
-    {"id": 101, "name": "麥當勞-中壢民族店", "location": "山下", "address": "桃園市中壢區民族路三段", "businesshours": "24小時營業", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "00:00", "end": "23:59"}]}]},
-    {"id": 102, "name": "壽司郎", "location": "山下", "address": "桃園市中壢區中正路", "businesshours": "11:00-22:00", "openingHours": [{"days": [0, 1, 2, 3, 4, 5, 6], "slots": [{"start": "11:00", "end": "22:00"}]}]},
-    {"id": 201, "name": "小木屋鬆餅", "location": "宵夜街", "address": "校園內", "businesshours": "07:30-19:00", "openingHours": [{"days": [1, 2, 3, 4, 5], "slots": [{"start": "07:30", "end": "19:00"}]}]},
-]
+"""
+餐廳資料
+資料放在 restaurants.json，改檔案不用重啟：讀取時檢查檔案的 mtime（最多每 CHECK_INTERVAL 秒 stat 一次），
+有變動就重新載入並建好新的 RestaurantCatalog，再整個替換參照。
+重新載入時其他請求不會等待，繼續使用舊的目錄；檔案格式錯誤時保留舊的目錄
+"""
+import json
+import os
+import threading
+import time
+from restaurant_catalog import RestaurantCatalog
+
+DATA_FILE = os.getenv("RESTAURANTS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "restaurants.json"))
+CHECK_INTERVAL = 2.0     # 秒
+
+
+def read_restaurants(path=DATA_FILE):
+    with open(path, encoding="utf-8") as f:
+        restaurants = json.load(f)
+    if not isinstance(restaurants, list):
+        raise ValueError("restaurants.json 必須是餐廳的陣列")
+    return restaurants
+
+
+class CatalogLoader:
+    def __init__(self, path=DATA_FILE, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._mtime = os.stat(path).st_mtime_ns
+        self._checked_at = time.monotonic()
+        self._catalog = RestaurantCatalog(read_restaurants(path))
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            print(f"[ERROR] 無法讀取餐廳資料檔，繼續使用舊資料: {e}")
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            catalog = RestaurantCatalog(read_restaurants(self.path))
+        except Exception as e:
+            # 同一個版本的檔案只報一次錯，等檔案再次變動才重試
+            self._mtime = mtime
+            print(f"[ERROR] 餐廳資料重新載入失敗，繼續使用舊資料: {e}")
+            return
+        self._catalog = catalog
+        self._mtime = mtime
+        print(f"[DEBUG] 餐廳資料已重新載入，共 {len(catalog.restaurants)} 家")
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval and self._reload_lock.acquire(blocking=False):
+            # 只有搶到 lock 的請求負責檢查 / 重新載入
+            try:
+                self._checked_at = now
+                self._reload()
+            finally:
+                self._reload_lock.release()
+        return self._catalog
+
+
+loader = CatalogLoader()
+
+
+def get_catalog():
+    return loader.get()
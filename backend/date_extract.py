@@ -0,0 +1,288 @@
+"""
+郵件日期 / 時間擷取
+所有格式預先編譯成一個大的 alternation，每封郵件由左到右只掃一次；
+日期後面緊接的星期註記「(五)」、區間「-12/29」「至29日」與附近的時間在掃到日期時順便讀掉。
+每個候選依格式明確程度、星期是否吻合、有沒有時間、是否在主旨、前後文與是否已過期打分，
+回傳分數最高的日期與時間（含區間結尾），confidence 可以用來決定要不要相信本機結果
+支援：2024-12-27、2024年12月27日、民國113年12月27日、113/12/27、12/27/2024、12月27日、12/27、Dec 27、
+12/27-12/29、12/27~29、12月27日至29日、（下）週三、明天、14:30、下午2點半、2:30 PM、14:00-16:00、下午2點至4點
+"""
+import re
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from llm_engine import email_text
+
+TAIPEI = timezone(timedelta(hours=8))
+TIME_LINK_CHARS = 25        # 日期後面這麼多字以內的時間視為同一個事件的時間
+CONTEXT_CHARS = 12          # 往前看多少字找「時間」「截止」等提示詞
+ROC_OFFSET = 1911
+
+_PERIOD = r'上午|早上|中午|下午|晚上|傍晚|凌晨'
+_CN_NUM = r'[零〇一二兩三四五六七八九十]{1,3}'
+_WEEKDAY = r'[一二三四五六日天]'
+_MONTHS = r'jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?'
+_TO = r'\s*(?:-|~|～|–|—|至|到)\s*'
+
+# (名稱, 基本分數, pattern)；group 名稱以格式名稱開頭，單一 alternation 內不能重複
+_PATTERNS = [
+    ('roc', 0.95, r'民國\s*(?P<roc_y>\d{2,3})\s*年\s*(?P<roc_m>\d{1,2})\s*月\s*(?P<roc_d>\d{1,2})\s*[日號]?'),
+    ('ymdc', 0.95, r'(?<!\d)(?P<ymdc_y>(?:19|20)\d{2}|1\d{2})\s*年\s*(?P<ymdc_m>\d{1,2})\s*月\s*(?P<ymdc_d>\d{1,2})\s*[日號]?'),
+    ('ymd', 0.9, r'(?<![\d/.])(?P<ymd_y>(?:19|20)\d{2}|1\d{2})(?P<ymd_s>[/.-])(?P<ymd_m>\d{1,2})(?P=ymd_s)(?P<ymd_d>\d{1,2})(?![\d/.])'),
+    ('mdy', 0.85, r'(?<![\d/])(?P<mdy_m>\d{1,2})/(?P<mdy_d>\d{1,2})/(?P<mdy_y>(?:19|20)\d{2})(?!\d)'),
+    ('mdc', 0.8, r'(?<!\d)(?P<mdc_m>\d{1,2})\s*月\s*(?P<mdc_d>\d{1,2})\s*[日號]'),
+    ('md', 0.65, r'(?<![\d/.:])(?P<md_m>\d{1,2})/(?P<md_d>\d{1,2})(?![\d/])'),
+    ('en', 0.8, r'\b(?P<en_mon>' + _MONTHS + r')\.?\s+(?P<en_d>\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s+(?P<en_y>(?:19|20)\d{2})\b)?'),
+    ('enr', 0.8, r'\b(?P<enr_d>\d{1,2})(?:st|nd|rd|th)?\s+(?P<enr_mon>' + _MONTHS + r')\b\.?(?:,?\s+(?P<enr_y>(?:19|20)\d{2})\b)?'),
+    ('rel', 0.6, r'(?P<rel_w>大後天|後天|明天|明日|今天|今日)'),
+    ('wk', 0.55, r'(?:(?P<wk_pre>下下|下|本|這)\s*)?(?:週|星期|禮拜)(?P<wk_d>' + _WEEKDAY + r')'),
+    ('hm', 0.8, r'(?:(?P<hm_p>' + _PERIOD + r')\s*)?(?<!\d)(?P<hm_h>\d{1,2})[:：](?P<hm_m>\d{2})(?!\d)(?:\s*(?P<hm_ap>[ap]\.?m\b\.?))?'),
+    # 中文數字一定要有時段（「快一點」不是一點）
+    ('ct', 0.6, r'(?:(?P<ct_p>' + _PERIOD + r')\s*(?P<ct_h>\d{1,2}|' + _CN_NUM + r')|(?<![\d.])(?P<ct_d>\d{1,2}))'
+                r'\s*[點点時](?:\s*(?P<ct_half>半)|\s*(?P<ct_m>\d{1,2})\s*分)?'),
+    ('ap', 0.8, r'(?<![\d:.])(?P<ap_h>\d{1,2})\s*(?P<ap_ap>[ap]\.?m\b\.?)'),
+]
+# 開頭的 lookahead 先用一個字元、再用各格式的開頭字串濾掉不可能的位置，不用在每個位置把所有格式都試一遍
+_TOKEN_RE = re.compile(
+    r'(?=[\d今明後大下本這週星禮上早中晚傍凌民jfmasond])'
+    r'(?=\d|[今明][天日]|大?後天|[下本這]\s*(?:週|星期|禮拜)|下下|週|星期|禮拜|' + _PERIOD + r'|民國|'
+    r'jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)(?:'
+    + '|'.join(f'(?P<{name}>{pattern})' for name, _, pattern in _PATTERNS) + ')',
+    re.I
+)
+_BASE_SCORE = {name: score for name, score, _ in _PATTERNS}
+_DATE_KINDS = {'roc', 'ymdc', 'ymd', 'mdy', 'mdc', 'md', 'en', 'enr', 'rel', 'wk'}
+
+# 日期後面緊接的部分，從日期結尾直接 match，不另外掃整段文字
+_WEEKDAY_TAIL = re.compile(r'\s*(?:[(（]\s*(?:週|星期|禮拜)?(?P<wd>' + _WEEKDAY + r')\s*[)）]|(?:週|星期|禮拜)(?P<wd2>' + _WEEKDAY + r'))')
+_DATE_RANGE_TAIL = re.compile(
+    _TO + r'(?:(?P<y>(?:19|20)\d{2}|1\d{2})\s*[/.年-]\s*)?(?:(?P<m>\d{1,2})\s*[/.月-]\s*)?(?P<d>\d{1,2})(?![\d:])\s*[日號]?'
+)
+_TIME_RANGE_TAIL = re.compile(
+    _TO + r'(?P<p>' + _PERIOD + r')?\s*(?P<h>\d{1,2}|' + _CN_NUM + r')\s*'
+    r'(?:[:：](?P<m>\d{2})(?:\s*(?P<ap>[ap]\.?m\b\.?))?|[點点時](?:\s*(?P<half>半)|\s*(?P<m2>\d{1,2})\s*分)?|(?P<ap2>[ap]\.?m\b\.?))',
+    re.I
+)
+_CONTEXT_RE = re.compile(r'時間|日期|截止|期限|舉辦|舉行|活動|會議|開會|報名|deadline|due|date|when|time', re.I)
+
+_MONTH_NUM = {m: i for i, m in enumerate(['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+_WEEKDAY_NUM = {c: i for i, c in enumerate('一二三四五六日')}
+_WEEKDAY_NUM['天'] = 6
+_RELATIVE_DAYS = {'今天': 0, '今日': 0, '明天': 1, '明日': 1, '後天': 2, '大後天': 3}
+_CN_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '兩': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+
+
+def _number(text):
+    """阿拉伯數字或「十二」「兩」這類中文數字"""
+    if text.isdigit():
+        return int(text)
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        return (_CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (_CN_DIGITS.get(ones, 0) if ones else 0)
+    return _CN_DIGITS.get(text, -1)
+
+
+def _year(text):
+    year = int(text)
+    return year + ROC_OFFSET if year < 1000 else year
+
+
+def _make_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _infer_year(month, day, reference):
+    """沒寫年份時取離參考日期最近的那一年（12 月寄出的信寫 1/5 是明年）"""
+    candidate = _make_date(reference.year, month, day)
+    if candidate and (candidate - reference).days < -180:
+        candidate = _make_date(reference.year + 1, month, day)
+    return candidate
+
+
+def _hour24(hour, minute, period=None, ampm=None):
+    if period in ('下午', '晚上', '傍晚') and hour < 12:
+        hour += 12
+    elif period == '中午' and hour < 6:
+        hour += 12
+    elif period in ('凌晨', '上午', '早上') and hour == 12:
+        hour = 0
+    if ampm:
+        ampm = ampm[0].lower()
+        if ampm == 'p' and hour < 12:
+            hour += 12
+        elif ampm == 'a' and hour == 12:
+            hour = 0
+    if 0 <= hour <= 23 and 0 <= minute <= 59:
+        return f"{hour:02d}:{minute:02d}"
+    return None
+
+
+def _weekday_date(prefix, weekday, reference):
+    if prefix in ('本', '這', '下', '下下'):
+        monday = reference - timedelta(days=reference.weekday())
+        weeks = {'本': 0, '這': 0, '下': 1, '下下': 2}[prefix]
+        return monday + timedelta(days=weeks * 7 + weekday)
+    # 只寫「週三」：參考日當天或之後最近的週三
+    return reference + timedelta(days=(weekday - reference.weekday()) % 7)
+
+
+def _parse_date(kind, g, reference):
+    if kind == 'roc':
+        return _make_date(int(g['roc_y']) + ROC_OFFSET, int(g['roc_m']), int(g['roc_d']))
+    if kind in ('ymdc', 'ymd', 'mdy'):
+        return _make_date(_year(g[kind + '_y']), int(g[kind + '_m']), int(g[kind + '_d']))
+    if kind in ('mdc', 'md'):
+        return _infer_year(int(g[kind + '_m']), int(g[kind + '_d']), reference)
+    if kind in ('en', 'enr'):
+        month, day = _MONTH_NUM[g[kind + '_mon'][:3].lower()], int(g[kind + '_d'])
+        if g[kind + '_y']:
+            return _make_date(int(g[kind + '_y']), month, day)
+        return _infer_year(month, day, reference)
+    if kind == 'rel':
+        return reference + timedelta(days=_RELATIVE_DAYS[g['rel_w']])
+    return _weekday_date(g['wk_pre'], _WEEKDAY_NUM[g['wk_d']], reference)
+
+
+def _parse_time(kind, g):
+    """回傳 (HH:MM, 時段)，時段給區間結尾沿用（「下午2點至4點」）"""
+    if kind == 'hm':
+        return _hour24(int(g['hm_h']), int(g['hm_m']), g['hm_p'], g['hm_ap']), g['hm_p'] or g['hm_ap']
+    if kind == 'ct':
+        minute = 30 if g['ct_half'] else int(g['ct_m'] or 0)
+        return _hour24(_number(g['ct_h'] or g['ct_d']), minute, g['ct_p']), g['ct_p']
+    return _hour24(int(g['ap_h']), 0, None, g['ap_ap']), g['ap_ap']
+
+
+def _time_score(kind, g):
+    score = _BASE_SCORE[kind]
+    if (kind == 'hm' and (g['hm_p'] or g['hm_ap'])) or (kind == 'ct' and g['ct_p']):
+        score += 0.1
+    return score
+
+
+def _date_range_end(text, pos, start, reference):
+    match = _DATE_RANGE_TAIL.match(text, pos)
+    if not match:
+        return None, pos
+    if match['y'] and match['m']:
+        end = _make_date(_year(match['y']), int(match['m']), int(match['d']))
+    elif match['m']:
+        end = _make_date(start.year, int(match['m']), int(match['d']))
+        if end and end < start:
+            end = _make_date(start.year + 1, int(match['m']), int(match['d']))
+    else:
+        end = _make_date(start.year, start.month, int(match['d']))
+    if not end or end <= start or (end - start).days > 62:
+        return None, pos
+    # 區間結尾後面也可能有星期註記
+    weekday = _WEEKDAY_TAIL.match(text, match.end())
+    return end, weekday.end() if weekday else match.end()
+
+
+def _time_range_end(text, pos, period):
+    match = _TIME_RANGE_TAIL.match(text, pos)
+    if not match:
+        return None, pos
+    hour = _number(match['h'])
+    if match['m']:
+        minute = int(match['m'])
+    else:
+        minute = 30 if match['half'] else int(match['m2'] or 0)
+    ampm = match['ap'] or match['ap2'] or (period if period and period[0] in 'aApP' else None)
+    end = _hour24(hour, minute, match['p'] or (None if ampm else period), ampm)
+    return (end, match.end()) if end else (None, pos)
+
+
+def _score_date(candidate, text, reference, subject_end):
+    score = _BASE_SCORE[candidate['format']]
+    score += {True: 0.05, False: -0.3, None: 0}[candidate.pop('weekday_ok')]
+    if candidate['time']:
+        score += 0.05
+    if candidate['start'] < subject_end:
+        score += 0.05
+    if _CONTEXT_RE.search(text, max(0, candidate['start'] - CONTEXT_CHARS), candidate['start']):
+        score += 0.05
+    days = (date.fromisoformat(candidate['date']) - reference).days
+    if days < 0:
+        score -= 0.25       # 活動通常在寄信之後
+    elif days > 400:
+        score -= 0.2
+    return round(min(max(score, 0.0), 1.0), 3)
+
+
+def extract(text, reference=None, subject_end=0):
+    """
+    掃一次 text，回傳 {date, end_date, time, end_time, confidence, candidates}。
+    reference 是相對日期（明天、週三、沒寫年份）的基準，通常用寄信日期；subject_end 之前的文字算主旨
+    """
+    reference = reference or datetime.now(TAIPEI).date()
+    dates, times = [], []
+    pos = 0
+    while True:
+        match = _TOKEN_RE.search(text, pos)
+        if not match:
+            break
+        kind, g = match.lastgroup, match.groupdict()
+        pos = match.end()
+        if kind in _DATE_KINDS:
+            value = _parse_date(kind, g, reference)
+            if not value:
+                continue
+            candidate = {'format': kind, 'date': value.isoformat(), 'end_date': None, 'time': None, 'end_time': None,
+                         'start': match.start(), 'end': pos, 'weekday_ok': None}
+            weekday = _WEEKDAY_TAIL.match(text, pos) if kind != 'wk' else None
+            if weekday:
+                candidate['weekday_ok'] = _WEEKDAY_NUM[weekday['wd'] or weekday['wd2']] == value.weekday()
+                pos = weekday.end()
+            end, pos = _date_range_end(text, pos, value, reference)
+            if end:
+                candidate['end_date'] = end.isoformat()
+            candidate['end'] = pos
+            dates.append(candidate)
+        else:
+            value, period = _parse_time(kind, g)
+            if not value:
+                continue
+            candidate = {'format': kind, 'time': value, 'end_time': None, 'start': match.start(), 'score': _time_score(kind, g)}
+            end, pos = _time_range_end(text, pos, period)
+            candidate['end_time'] = end
+            candidate['end'] = pos
+            times.append(candidate)
+            # 緊跟在日期後面的時間就是那個日期的時間
+            last = dates[-1] if dates else None
+            if last and not last['time'] and 0 <= candidate['start'] - last['end'] <= TIME_LINK_CHARS:
+                last['time'], last['end_time'] = value, end
+                candidate['linked'] = True
+
+    for candidate in dates:
+        candidate['score'] = _score_date(candidate, text, reference, subject_end)
+    # 分數相同時取先出現的
+    best_date = max(dates, key=lambda c: (c['score'], -c['start']), default=None)
+    best_time = max((c for c in times if not c.get('linked')), key=lambda c: (c['score'], -c['start']), default=None)
+    result = {'date': None, 'end_date': None, 'time': None, 'end_time': None, 'confidence': 0.0,
+              'candidates': sorted(dates + times, key=lambda c: c['start'])}
+    if best_date:
+        result.update(date=best_date['date'], end_date=best_date['end_date'], confidence=best_date['score'])
+        if best_date['time']:
+            result.update(time=best_date['time'], end_time=best_date['end_time'])
+    if not result['time'] and best_time:
+        result.update(time=best_time['time'], end_time=best_time['end_time'])
+        if not best_date:
+            result['confidence'] = round(best_time['score'] * 0.5, 3)    # 只有時間沒有日期，不足以單獨成立
+    return result
+
+
+def sent_date(email):
+    """郵件的寄件日期（台北時間），解析不了就回傳 None"""
+    try:
+        return parsedate_to_datetime(email['date']).astimezone(TAIPEI).date() if email.get('date') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_email(email, reference=None):
+    """以主旨 + 內文（或 snippet）擷取，相對日期以寄件日期為基準"""
+    subject = email.get('subject', '')
+    return extract(subject + '\n' + email_text(email), reference or sent_date(email), subject_end=len(subject))
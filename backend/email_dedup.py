@@ -0,0 +1,83 @@
+"""
+分析前的郵件去重
+1. 同一個 Gmail threadId 的郵件（回覆串、轉寄）歸成一群
+2. 主旨 + 內容算 64-bit SimHash，漢明距離 <= MAX_DISTANCE 且擷取到的日期相同的郵件歸成一群
+   （內容幾乎一樣但日期不同的提醒是不同的活動，不合併）
+SimHash 切成 BANDS 段，只跟至少有一段完全相同的代表比較（距離 <= 3 時必定有一段相同），不用兩兩比對
+每群只有代表（清單中最前面、也就是最新的一封）送去判斷，判斷結果再套用到其他郵件
+"""
+import hashlib
+import re
+from collections import defaultdict
+
+BITS = 64
+BANDS = 4                   # 4 段 x 16 bits；距離 <= 3 的兩個 hash 至少有一段相同
+MAX_DISTANCE = 3
+
+_CJK_RUN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]+')
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_REPLY_PREFIX_RE = re.compile(r'^\s*((re|fw|fwd|回覆|轉寄|答覆)\s*[:：]\s*)+', re.I)
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def shingles(text):
+    """中日韓文字取 2-gram、其他取英數單字；主旨的 Re: / Fwd: 前綴先拿掉"""
+    text = _REPLY_PREFIX_RE.sub('', text).lower()
+    tokens = _WORD_RE.findall(text)
+    for run in _CJK_RUN_RE.findall(text):
+        tokens.extend(run[i:i + 2] for i in range(max(len(run) - 1, 1)))
+    return tokens
+
+
+def simhash(text):
+    weights = [0] * BITS
+    for token in shingles(text):
+        h = _token_hash(token)
+        for bit in range(BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(BITS) if weights[bit] > 0)
+
+
+def _bands(value):
+    width = BITS // BANDS
+    mask = (1 << width) - 1
+    return [(band, value >> (band * width) & mask) for band in range(BANDS)]
+
+
+def cluster(emails, text_of, key_of=None, max_distance=MAX_DISTANCE):
+    """
+    回傳 (代表清單, {代表 id: [同一群的其他郵件]})，代表依原本順序。
+    text_of(email) 取比對用的文字；key_of(email) 不同的郵件即使內容相近也不合併。
+    每封郵件只跟各群的代表比較（不會 A 像 B、B 像 C 就把 A 和 C 串在一起）
+    """
+    representatives, members = [], defaultdict(list)
+    thread_leader = {}                  # threadId -> 代表
+    buckets = defaultdict(list)         # (段, 值) -> [(hash, key, 代表)]
+    for email in emails:
+        thread = email.get('threadId')
+        leader = thread_leader.get(thread) if thread else None
+        if leader is None:
+            value = simhash(text_of(email))
+            key = key_of(email) if key_of else None
+            bands = _bands(value)
+            leader = next((
+                rep for band in bands for rep_value, rep_key, rep in buckets[band]
+                if rep_key == key and bin(value ^ rep_value).count('1') <= max_distance
+            ), None)
+            if leader is None:
+                leader = email
+                representatives.append(email)
+                for band in bands:
+                    buckets[band].append((value, key, email))
+        if leader is not email:
+            members[leader['id']].append(email)
+        if thread:
+            thread_leader.setdefault(thread, leader)
+    return representatives, dict(members)
+
+
+def dedup_ratio(total, representatives):
+    return round(1 - representatives / total, 3) if total else 0.0
@@ -0,0 +1,178 @@
+"""
+比對建議行程是否已經在行事曆上
+衝突檢查只知道那段時間有沒有事件，分不出「這個活動已經加過了」和「那天剛好有別的事」。
+每次分析把行事曆視窗內的事件建成索引一次：
+1. 標題正規化成 token（中日韓文字 2-gram、英數單字，去掉 Re: / Fwd: 與「通知」「提醒」這類字），
+   以 IDF 加權，常見的 token（例如「會議」）權重低
+2. 以 (日期, token) 建反向索引，每個建議只比對前後 WINDOW_DAYS 天內、至少有一個共同 token 的事件；
+   分數 = 標題相似度 x 時間接近程度，超過 DUPLICATE_SCORE 視為已存在
+3. 可選的本機語意向量：有安裝 sentence-transformers 並設定 EVENT_EMBEDDING_MODEL 時，
+   標題相似度取 token 相似度與向量 cosine 的較大者（只用 CPU，事件標題在建索引時一次算完）
+"""
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from datetime import timedelta
+from calendar_index import TAIPEI, parse_event_time
+from email_dedup import shingles
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+WINDOW_DAYS = 1                 # 前後各多查一天，跨午夜的事件也比得到
+DUPLICATE_SCORE = 0.6
+EVENT_SIDE = 0.7                # 標題相似度中「既有事件標題被涵蓋的比例」的權重
+MIN_SHARED_TOKENS = 2
+TIME_SCALE_HOURS = 12.0         # 兩個時間區間相隔這麼多小時，時間分數降到 1/e（每週固定的同名活動不會被當成重複）
+EMBEDDING_MODEL = os.getenv("EVENT_EMBEDDING_MODEL", "")
+
+# 通知類郵件主旨常見、但不代表是哪個活動的字
+_STOP_TOKENS = {
+    '通知', '提醒', '公告', '邀請', '活動', '轉寄', '回覆', '敬邀', '歡迎', '報名', '重要',
+    're', 'fw', 'fwd', 'reminder', 'notice', 'invitation', 'invite', 'event', 'the', 'and', 'of',
+}
+_BRACKET_RE = re.compile(r'[【】\[\]「」『』()（）<>《》]')
+
+_embedder = None
+
+
+def title_tokens(title):
+    """標題轉成去重後的 token 集合"""
+    text = _BRACKET_RE.sub(' ', title or '')
+    return {token for token in shingles(text) if token not in _STOP_TOKENS}
+
+
+def _embedding_model():
+    """沒有設定模型或沒有安裝 sentence-transformers 時回傳 None；模型只載入一次"""
+    global _embedder
+    if _embedder is None and SentenceTransformer is not None and EMBEDDING_MODEL:
+        try:
+            _embedder = SentenceTransformer(EMBEDDING_MODEL, device='cpu')
+        except Exception as e:
+            print(f"[ERROR] 載入語意向量模型 {EMBEDDING_MODEL} 失敗: {e}")
+            _embedder = False
+    return _embedder or None
+
+
+def time_score(start, end, other_start, other_end):
+    """兩個區間重疊時為 1，相隔越久越接近 0"""
+    gap = max(start, other_start) - min(end, other_end)
+    hours = max(gap.total_seconds(), 0) / 3600
+    return math.exp(-hours / TIME_SCALE_HOURS)
+
+
+class EventMatchIndex:
+    def __init__(self, events):
+        self._entries = []                  # [(start, end, 權重總和, event)]
+        self._postings = defaultdict(list)  # (date, token) -> [(entries 的 index, 權重)]
+        self._days = defaultdict(list)      # date -> [entries 的 index]（只有語意向量會用到）
+        parsed = []
+        for event in events:
+            if event.get('status') == 'cancelled':
+                continue
+            try:
+                start = parse_event_time(event['start'])
+                end = parse_event_time(event['end'])
+            except (KeyError, ValueError):
+                continue
+            tokens = title_tokens(event.get('summary', ''))
+            if tokens:
+                parsed.append((start, max(end, start + timedelta(minutes=1)), tokens, event))
+
+        # IDF：在這段期間的行事曆裡越常出現的 token 越不具代表性
+        df = Counter(token for _, _, tokens, _ in parsed for token in tokens)
+        total = len(parsed)
+        self._idf = {token: math.log((total + 1) / (count + 1)) + 1 for token, count in df.items()}
+        self._default_idf = math.log(total + 1) + 1
+
+        for start, end, tokens, event in parsed:
+            position = len(self._entries)
+            self._entries.append((start, end, sum(self._idf[token] for token in tokens), event))
+            day = start.astimezone(TAIPEI).date()
+            last_day = (end - timedelta(microseconds=1)).astimezone(TAIPEI).date()
+            while day <= last_day:
+                self._days[day].append(position)
+                for token in tokens:
+                    self._postings[day, token].append((position, self._idf[token]))
+                day += timedelta(days=1)
+
+        self._vectors = None
+        self._query_vectors = {}
+        model = _embedding_model() if self._entries else None
+        if model:
+            titles = [entry[3].get('summary', '') for entry in self._entries]
+            self._vectors = model.encode(titles, normalize_embeddings=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def prepare(self, titles):
+        """有語意向量時先把要查詢的標題一次算好，之後每次查詢只剩內積"""
+        model = _embedding_model() if self._vectors is not None else None
+        titles = [title for title in dict.fromkeys(titles) if title not in self._query_vectors]
+        if model and titles:
+            for title, vector in zip(titles, model.encode(titles, normalize_embeddings=True)):
+                self._query_vectors[title] = vector
+
+    def _shared(self, tokens, start, end):
+        """前後 WINDOW_DAYS 天內、和建議標題有共同 token 的事件：{entries 的 index: [共同 token 的權重]}"""
+        shared = defaultdict(dict)
+        day = start.astimezone(TAIPEI).date() - timedelta(days=WINDOW_DAYS)
+        last_day = (end - timedelta(microseconds=1)).astimezone(TAIPEI).date() + timedelta(days=WINDOW_DAYS)
+        while day <= last_day:
+            for token in tokens:
+                for position, weight in self._postings.get((day, token), ()):
+                    # 跨日事件在每一天都有 posting，同一個 token 只算一次
+                    shared[position][token] = weight
+            day += timedelta(days=1)
+        return shared
+
+    def title_similarity(self, shared, query_weight, position, title=None):
+        """
+        既有標題有多少（加權後的）token 出現在建議標題裡為主、反過來為輔（郵件主旨通常比行事曆標題長）；
+        只共用一個 token（例如都叫「會議」）的分數打折。有語意向量時再和 cosine 取大
+        """
+        weight = self._entries[position][2]
+        similarity = 0.0
+        if shared:
+            total = sum(shared)
+            similarity = (EVENT_SIDE * total / weight + (1 - EVENT_SIDE) * total / query_weight) \
+                * min(1.0, len(shared) / MIN_SHARED_TOKENS)
+        vector = self._query_vectors.get(title) if self._vectors is not None else None
+        if vector is not None:
+            similarity = max(similarity, float(self._vectors[position] @ vector))
+        return similarity
+
+    def _candidates(self, start, end):
+        positions = set()
+        day = start.astimezone(TAIPEI).date() - timedelta(days=WINDOW_DAYS)
+        last_day = (end - timedelta(microseconds=1)).astimezone(TAIPEI).date() + timedelta(days=WINDOW_DAYS)
+        while day <= last_day:
+            positions.update(self._days.get(day, ()))
+            day += timedelta(days=1)
+        return positions
+
+    def find(self, title, start, end, threshold=DUPLICATE_SCORE):
+        """回傳 (最像的既有事件, 分數)；沒有超過門檻時事件是 None"""
+        tokens = title_tokens(title)
+        if not tokens or not self._entries:
+            return None, 0.0
+        query_weight = sum(self._idf.get(token, self._default_idf) for token in tokens)
+        candidates = self._shared(tokens, start, end)
+        if title in self._query_vectors:
+            # 語意向量可能認得沒有共同 token 的標題，時間窗內的事件都要比
+            for position in self._candidates(start, end):
+                candidates.setdefault(position, {})
+        best, best_score = None, 0.0
+        for position, shared in candidates.items():
+            similarity = self.title_similarity(list(shared.values()), query_weight, position, title)
+            if similarity < threshold or similarity <= best_score:
+                continue        # 時間分數最多是 1，標題不夠像就不用再算時間
+            event_start, event_end, _, event = self._entries[position]
+            score = similarity * time_score(start, end, event_start, event_end)
+            if score > best_score:
+                best, best_score = event, score
+        return (best if best_score >= threshold else None), round(best_score, 3)
@@ -0,0 +1,286 @@
+"""
+本機假 Google API 伺服器（離線 benchmark 用）
+模擬 Gmail 的 messages.list / messages.get / history.list、Calendar 的 events.list / insert / delete 以及 batch 端點，每個 HTTP 請求都會加上固定延遲來模擬網路來回
+使用方式：python fake_google_api.py [port] [latency_ms]
+"""
+import sys
+import json
+import base64
+import time
+import random
+import threading
+from email.parser import BytesParser
+from email.policy import compat32
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+SUBJECTS = [
+    "期末專題報告繳交提醒", "社團迎新茶會 12/27 下午2點", "Your weekly newsletter",
+    "課程異動通知", "Meeting: project sync 14:30", "圖書館借閱到期通知",
+]
+
+
+def b64url(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def make_payload(subject, headers, body_text):
+    """format='full' 的 MIME 結構：multipart/mixed = alternative(純文字, HTML) + 附件"""
+    html = f"<html><head><style>p {{color: red}}</style></head><body><h1>{subject}</h1><p>{body_text}</p></body></html>"
+    return {
+        "mimeType": "multipart/mixed",
+        "headers": headers,
+        "body": {"size": 0},
+        "parts": [
+            {"partId": "0", "mimeType": "multipart/alternative", "body": {"size": 0}, "parts": [
+                {"partId": "0.0", "mimeType": "text/plain",
+                 "headers": [{"name": "Content-Type", "value": "text/plain; charset=\"UTF-8\""}],
+                 "body": {"size": len(body_text), "data": b64url(body_text)}},
+                {"partId": "0.1", "mimeType": "text/html",
+                 "headers": [{"name": "Content-Type", "value": "text/html; charset=\"UTF-8\""}],
+                 "body": {"size": len(html), "data": b64url(html)}},
+            ]},
+            {"partId": "1", "mimeType": "application/pdf", "filename": "附件.pdf",
+             "headers": [{"name": "Content-Disposition", "value": "attachment; filename=\"附件.pdf\""}],
+             "body": {"size": 123456, "attachmentId": "ANGjdJ_fake"}},
+        ],
+    }
+
+
+def make_mailbox(count=200, seed=42):
+    """產生假信箱資料"""
+    rng = random.Random(seed)
+    mailbox = {}
+    for i in range(count):
+        msg_id = f"{i:016x}"
+        subject = rng.choice(SUBJECTS)
+        mailbox[msg_id] = {
+            "id": msg_id,
+            "threadId": f"{i // 3:016x}",
+            "historyId": str(1000 + i),
+            "internalDate": str(1735000000000 - i * 60000),
+            "labelIds": ["INBOX"],
+            "snippet": f"{subject} 內文摘要 #{i}",
+            "payload": make_payload(subject, [
+                {"name": "Subject", "value": subject},
+                {"name": "From", "value": f"sender{i % 7}@example.com"},
+                {"name": "Date", "value": "Fri, 27 Dec 2024 10:00:00 +0800"},
+                {"name": "To", "value": "me@example.com"},
+            ], f"{subject} 內文摘要 #{i}。詳細資訊：時間為 2024/12/{27 + i % 3} 下午2點半，地點在工程一館 E1-{100 + i % 50} 教室，請準時出席。"),
+        }
+    return mailbox
+
+
+class FakeGoogleState:
+    def __init__(self, mailbox=None, latency=0.05, fail_every=0):
+        self.mailbox = mailbox if mailbox is not None else make_mailbox()
+        self.latency = latency
+        self.fail_every = fail_every  # 每 N 個 API 呼叫回一次 429，用來測試重試
+        self.lock = threading.Lock()
+        self.http_requests = 0     # 實際收到的 HTTP 連線請求數
+        self.api_calls = 0         # 展開 batch 後的 API 呼叫數
+        self.history_id = 1000 + len(self.mailbox)
+        self.history = []          # [(historyId, {"messagesAdded": [...]})]
+        self.events = {}           # event id -> (變動序號, event)
+        self.event_seq = 0
+
+    def add_message(self, subject="新郵件"):
+        """模擬收到新郵件，同時寫一筆 history"""
+        with self.lock:
+            self.history_id += 1
+            msg_id = f"{self.history_id:016x}"
+            self.mailbox[msg_id] = {
+                "id": msg_id,
+                "threadId": msg_id,
+                "historyId": str(self.history_id),
+                "internalDate": str(1736000000000 + self.history_id),
+                "labelIds": ["INBOX", "UNREAD"],
+                "snippet": f"{subject} 內文摘要",
+                "payload": {"mimeType": "text/plain", "headers": [
+                    {"name": "Subject", "value": subject},
+                    {"name": "From", "value": "new@example.com"},
+                    {"name": "Date", "value": "Sat, 28 Dec 2024 09:00:00 +0800"},
+                ], "body": {"size": 0}},
+            }
+            self.history.append((self.history_id, {
+                "messagesAdded": [{"message": {"id": msg_id, "threadId": msg_id, "labelIds": ["INBOX"]}}]
+            }))
+            return msg_id
+
+    def put_event(self, event):
+        """新增或修改行事曆事件，並記錄變動序號（給 syncToken 用）"""
+        with self.lock:
+            self.event_seq += 1
+            event = dict(event, id=event.get('id') or f"evt{self.event_seq}", status=event.get('status', 'confirmed'))
+            self.events[event['id']] = (self.event_seq, event)
+            return event
+
+    def delete_message(self, msg_id):
+        with self.lock:
+            self.history_id += 1
+            self.mailbox.pop(msg_id, None)
+            self.history.append((self.history_id, {
+                "messagesDeleted": [{"message": {"id": msg_id, "threadId": msg_id}}]
+            }))
+
+    def count(self, http=0, api=0):
+        with self.lock:
+            self.http_requests += http
+            self.api_calls += api
+
+    def dispatch(self, method, path, query, body=None):
+        """處理單一 API 呼叫，回傳 (status, dict)"""
+        self.count(api=1)
+        if self.fail_every and self.api_calls % self.fail_every == 0:
+            return 429, {"error": {"code": 429, "message": "Rate Limit Exceeded"}}
+        parts = [p for p in path.split('/') if p]
+
+        if parts == ['gmail', 'v1', 'users', 'me', 'profile']:
+            return 200, {"emailAddress": "me@example.com", "historyId": str(self.history_id)}
+
+        if parts == ['gmail', 'v1', 'users', 'me', 'history']:
+            start = int(query['startHistoryId'][0])
+            if self.history and start < self.history[0][0] - 1:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            records = [{"id": str(hid), **record} for hid, record in self.history if hid > start]
+            return 200, {"history": records, "historyId": str(self.history_id)}
+
+        # /gmail/v1/users/me/messages[/id]
+        if parts[:5] == ['gmail', 'v1', 'users', 'me', 'messages'] and method == 'GET':
+            if len(parts) == 5:
+                limit = int(query.get('maxResults', ['100'])[0])
+                ids = sorted(self.mailbox, key=lambda k: -int(self.mailbox[k]['internalDate']))
+                messages = [{"id": i, "threadId": self.mailbox[i]["threadId"]} for i in ids[:limit]]
+                return 200, {"messages": messages, "resultSizeEstimate": len(messages)}
+            msg = self.mailbox.get(parts[5])
+            if not msg:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            if query.get('format', ['full'])[0] == 'metadata':
+                wanted = set(query.get('metadataHeaders', []))
+                payload = {k: v for k, v in msg["payload"].items() if k != "parts"}
+                payload["headers"] = [h for h in payload["headers"] if not wanted or h["name"] in wanted]
+                msg = {**msg, "payload": payload}
+            return 200, msg
+
+        # /calendar/v3/calendars/primary/events[/id]
+        if parts[:5] == ['calendar', 'v3', 'calendars', 'primary', 'events']:
+            return self._dispatch_calendar(method, parts[5:], query, body)
+
+        return 404, {"error": {"code": 404, "message": f"Unknown path {path}"}}
+
+    def _dispatch_calendar(self, method, rest, query, body):
+        if method == 'POST' and not rest:
+            event = json.loads(body or b"{}")
+            if event.get('id') in self.events:
+                # 和 Google 一樣，指定的 id 已存在時回 409
+                return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+            return 200, self.put_event(event)
+
+        if method == 'DELETE' and rest:
+            if rest[0] not in self.events:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            self.put_event({**self.events[rest[0]][1], "status": "cancelled"})
+            return 204, {}
+
+        if method == 'GET' and not rest:
+            if 'syncToken' in query:
+                since = int(query['syncToken'][0])
+                items = [event for seq, event in self.events.values() if seq > since]
+            else:
+                time_min, time_max = query.get('timeMin', [''])[0], query.get('timeMax', ['~'])[0]
+                items = [
+                    event for _, event in self.events.values()
+                    if event['status'] != 'cancelled'
+                    and time_min <= event['start'].get('dateTime', event['start'].get('date', '')) < time_max
+                ]
+            return 200, {"items": items, "nextSyncToken": str(self.event_seq)}
+
+        return 404, {"error": {"code": 404, "message": "Unknown calendar call"}}
+
+
+def _render_batch_response(state, content_type, body):
+    """解析 multipart/mixed 的 batch 請求並逐一分派"""
+    message = BytesParser(policy=compat32).parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+    )
+    boundary = "batch_fake_boundary"
+    chunks = []
+    for part in message.get_payload():
+        inner = part.get_payload().replace('\r\n', '\n')
+        head, _, inner_body = inner.partition('\n\n')
+        method, target, _ = head.split('\n', 1)[0].strip().split(' ', 2)
+        url = urlsplit(target)
+        status, payload = state.dispatch(method, url.path, parse_qs(url.query), inner_body.encode())
+        content_id = part['Content-ID'].strip()
+        reason = "OK" if status == 200 else "Error"
+        chunks.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <response-{content_id[1:-1]}>\r\n\r\n"
+            f"HTTP/1.1 {status} {reason}\r\n"
+            "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+            f"{json.dumps(payload)}\r\n"
+        )
+    chunks.append(f"--{boundary}--\r\n")
+    return f"multipart/mixed; boundary={boundary}", "".join(chunks).encode()
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, content_type, data):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self, method):
+            state.count(http=1)
+            time.sleep(state.latency)
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+
+            if url.path.startswith("/batch"):
+                content_type, data = _render_batch_response(state, self.headers["Content-Type"], body)
+                self._send(200, content_type, data)
+                return
+
+            status, payload = state.dispatch(method, url.path, parse_qs(url.query), body)
+            self._send(status, "application/json; charset=UTF-8", json.dumps(payload).encode())
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+    return Handler
+
+
+def start_server(state=None, port=0):
+    """在背景執行緒啟動假伺服器，回傳 (server, state, base_url)"""
+    state = state or FakeGoogleState()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    return server, state, base_url
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    server, state, base_url = start_server(FakeGoogleState(latency=latency_ms / 1000), port)
+    print(f"Fake Google API 執行中: {base_url} (延遲 {latency_ms} ms)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
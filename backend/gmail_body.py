@@ -0,0 +1,179 @@
+"""
+郵件內文擷取
+snippet 只有約 200 字，日期時間常常被截掉；內文模式改用 format='full' 取回 MIME 結構（也支援 format='raw'），
+逐層走訪 part，base64url 分段解碼、依 charset 漸進解碼、HTML 邊讀邊轉成純文字，
+全部都是 generator，累積到每封的 token 預算就停止，大型電子報與附件不會整份解碼到記憶體裡
+"""
+import base64
+import codecs
+import os
+import re
+from email.parser import BytesFeedParser
+from email.policy import compat32
+from html.parser import HTMLParser
+from llm_engine import estimate_tokens
+
+BODY_TOKEN_BUDGET = int(os.getenv("EMAIL_BODY_TOKEN_BUDGET", "600"))
+DECODE_CHUNK = 16384            # base64url 每次解碼的字元數，必須是 4 的倍數
+MAX_RAW_BYTES = 512 * 1024      # raw 格式最多解析前面這麼多 bytes，附件通常在最後面
+TEXT_TYPES = ('text/plain', 'text/html')
+
+_WS_RE = re.compile(r'\s+')
+_CHARSET_RE = re.compile(r'charset="?([\w.:-]+)', re.I)
+
+
+class _HTMLText(HTMLParser):
+    """HTML 轉純文字：略過 script / style / head，區塊標籤換成換行；可以分段 feed，take() 取出目前的文字"""
+    SKIP = {'script', 'style', 'head'}
+    BREAK = {'br', 'p', 'div', 'tr', 'li', 'table', 'section', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._skip = 0
+        self._out = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.BREAK:
+            self._out.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.BREAK:
+            self._out.append('\n')
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._out.append(data)
+
+    def take(self):
+        text = ''.join(self._out)
+        self._out = []
+        return text
+
+
+def iter_base64url(data, chunk_size=DECODE_CHUNK):
+    """分段解碼 base64url（Gmail 的 body.data / raw），每次產生一段 bytes"""
+    for start in range(0, len(data), chunk_size):
+        piece = data[start:start + chunk_size]
+        yield base64.urlsafe_b64decode(piece + '=' * (-len(piece) % 4))
+
+
+def _decoder(charset):
+    try:
+        return codecs.getincrementaldecoder(charset or 'utf-8')(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+def iter_text(chunks, mime_type, charset='utf-8'):
+    """把一個 part 的 bytes 片段轉成文字片段；多位元組字元或 HTML 標籤跨片段時會等下一段再輸出"""
+    decoder = _decoder(charset)
+    html = _HTMLText() if mime_type == 'text/html' else None
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if html:
+            html.feed(text)
+            text = html.take()
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if html:
+        html.feed(text)
+        html.close()
+        text = html.take()
+    if text:
+        yield text
+
+
+def _part_header(part, name):
+    headers = part.get('headers', [])
+    return next((h['value'] for h in headers if h['name'].lower() == name.lower()), '')
+
+
+def _is_attachment(part):
+    return bool(part.get('filename')) or _part_header(part, 'Content-Disposition').lower().startswith('attachment')
+
+
+def iter_text_parts(part):
+    """深度優先走訪 format='full' 的 payload，依序產生要讀的文字 part；multipart/alternative 只取一個版本（優先純文字）"""
+    mime_type = part.get('mimeType', '')
+    if mime_type.startswith('multipart/'):
+        children = part.get('parts', [])
+        if mime_type == 'multipart/alternative':
+            children = [c for c in children if c.get('mimeType') == 'text/plain'][:1] or children[-1:]
+        for child in children:
+            yield from iter_text_parts(child)
+    elif mime_type in TEXT_TYPES and not _is_attachment(part):
+        yield part
+
+
+def _iter_raw_parts(message):
+    """同 iter_text_parts，走訪 email.message.Message"""
+    if message.is_multipart():
+        children = message.get_payload()
+        if message.get_content_type() == 'multipart/alternative':
+            children = [c for c in children if c.get_content_type() == 'text/plain'][:1] or children[-1:]
+        for child in children:
+            yield from _iter_raw_parts(child)
+    elif message.get_content_type() in TEXT_TYPES and not message.get_filename() \
+            and message.get_content_disposition() != 'attachment':
+        yield message
+
+
+def _iter_raw_text(raw):
+    parser = BytesFeedParser(policy=compat32)
+    size = 0
+    for chunk in iter_base64url(raw):
+        parser.feed(chunk)
+        size += len(chunk)
+        if size >= MAX_RAW_BYTES:
+            break
+    for part in _iter_raw_parts(parser.close()):
+        # get_payload(decode=True) 會處理 quoted-printable / base64 傳輸編碼
+        payload = part.get_payload(decode=True)
+        if payload:
+            yield from iter_text([payload], part.get_content_type(), part.get_content_charset())
+            yield ' '
+
+
+def iter_message_text(msg):
+    """依序產生一封郵件（format='full' 或 'raw'）的內文片段"""
+    if msg.get('raw'):
+        yield from _iter_raw_text(msg['raw'])
+        return
+    for part in iter_text_parts(msg.get('payload', {})):
+        # 沒有 data 的 part 內容太大，要另外用 attachmentId 取，這裡略過
+        data = part.get('body', {}).get('data')
+        if data:
+            match = _CHARSET_RE.search(_part_header(part, 'Content-Type'))
+            yield from iter_text(iter_base64url(data), part['mimeType'], match.group(1) if match else 'utf-8')
+            yield ' '
+
+
+def _truncate(text, tokens):
+    """取 text 開頭估計不超過 tokens 的部分（estimate_tokens 隨長度遞增，用二分搜尋）"""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def extract_text(msg, token_budget=BODY_TOKEN_BUDGET):
+    """取出純文字內文，空白壓成一格，超過 token 預算就截斷（後面的內容不會再解碼）"""
+    pieces, used = [], 0
+    for text in iter_message_text(msg):
+        text = _WS_RE.sub(' ', text)
+        cost = estimate_tokens(text)
+        if used + cost > token_budget:
+            pieces.append(_truncate(text, token_budget - used))
+            break
+        pieces.append(text)
+        used += cost
+    return _WS_RE.sub(' ', ''.join(pieces)).strip()
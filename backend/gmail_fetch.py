@@ -0,0 +1,104 @@
+"""
+Gmail 讀取工具
+把逐封呼叫的 users().messages().get() 打包成 batch HTTP request，
+一次來回就能取回多封郵件（預設只拿 Subject / From / Date 三個標頭的 metadata；
+內文模式改拿 format='full'，由 gmail_body 擷取純文字內文）
+"""
+import re
+import time
+import gmail_body
+from google_batch import new_batch, is_retryable
+
+METADATA_HEADERS = ['Subject', 'From', 'Date']
+BATCH_SIZE = 50        # Gmail 單一 batch 上限 100，官方建議 50 以內比較不會被限流
+MAX_RETRIES = 3        # batch 內個別請求被限流 (429/5xx) 時的重試次數
+RETRY_BASE_DELAY = 1.0
+
+
+def list_message_ids(service, max_results=20, query=None):
+    """列出郵件 id，超過單頁上限時自動翻頁"""
+    ids = []
+    page_token = None
+    while len(ids) < max_results:
+        kwargs = {'userId': 'me', 'maxResults': min(max_results - len(ids), 500)}
+        if query:
+            kwargs['q'] = query
+        if page_token:
+            kwargs['pageToken'] = page_token
+
+        results = service.users().messages().list(**kwargs).execute()
+        ids.extend(m['id'] for m in results.get('messages', []))
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    return ids[:max_results]
+
+
+def _get_request(service, msg_id, fmt):
+    if fmt == 'metadata':
+        return service.users().messages().get(
+            userId='me', id=msg_id, format='metadata', metadataHeaders=METADATA_HEADERS
+        )
+    return service.users().messages().get(userId='me', id=msg_id, format=fmt)
+
+
+def fetch_messages(service, message_ids, fmt='metadata', batch_size=BATCH_SIZE, batch_uri=None):
+    """批次取得郵件，回傳順序與 message_ids 相同（取不到的會略過）"""
+    fetched = {}
+    remaining = list(dict.fromkeys(message_ids))  # batch 內 request_id 不能重複
+
+    for attempt in range(MAX_RETRIES + 1):
+        failed = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+            elif is_retryable(exception) and attempt < MAX_RETRIES:
+                failed.append(request_id)
+            else:
+                print(f"[ERROR] 讀取郵件 {request_id} 失敗: {exception}")
+
+        for start in range(0, len(remaining), batch_size):
+            batch = new_batch(service, callback, batch_uri)
+            for msg_id in remaining[start:start + batch_size]:
+                batch.add(_get_request(service, msg_id, fmt), request_id=msg_id)
+            batch.execute()
+
+        if not failed:
+            break
+
+        delay = RETRY_BASE_DELAY * (2 ** attempt)
+        print(f"[DEBUG] {len(failed)} 封郵件被限流，{delay} 秒後重試")
+        time.sleep(delay)
+        remaining = failed
+
+    return [fetched[msg_id] for msg_id in message_ids if msg_id in fetched]
+
+
+def get_header(msg, name, default=''):
+    headers = msg.get('payload', {}).get('headers', [])
+    return next((h['value'] for h in headers if h['name'] == name), default)
+
+
+def to_email(msg, default_subject='(無主旨)', default_sender='(未知寄件者)', body_budget=None):
+    """把 Gmail message resource 轉成前端與分析流程共用的 dict；body_budget 有值時另外放入截斷過的內文"""
+    snippet = re.sub(r'\s+', ' ', msg.get('snippet', '')).strip()
+    email = {
+        'id': msg['id'],
+        'threadId': msg.get('threadId'),
+        'subject': get_header(msg, 'Subject', default_subject),
+        'sender': get_header(msg, 'From', default_sender),
+        'snippet': snippet,
+        'date': get_header(msg, 'Date', ''),
+    }
+    if body_budget:
+        email['body'] = gmail_body.extract_text(msg, body_budget)
+    return email
+
+
+def fetch_emails(service, max_results=20, query=None, default_subject='(無主旨)', batch_uri=None, body_budget=None):
+    """list + batch get，一次取得最近的郵件 metadata（body_budget 有值時連內文一起取）"""
+    message_ids = list_message_ids(service, max_results=max_results, query=query)
+    messages = fetch_messages(service, message_ids, fmt='full' if body_budget else 'metadata', batch_uri=batch_uri)
+    return [to_email(msg, default_subject=default_subject, body_budget=body_budget) for msg in messages]
@@ -0,0 +1,207 @@
+"""
+Gmail 增量同步
+第一次（或 historyId 過期時）做完整的 list + batch get，之後只用 users().history().list
+取得新增/刪除的郵件並更新本機的郵件 metadata 表；
+郵件被刪除或移到垃圾桶後本機不足 max_results 封時，再 list 一次最新的郵件補上缺的
+"""
+from datetime import datetime
+from googleapiclient.errors import HttpError
+from sqlalchemy import Column, Integer, String, Text, BigInteger, DateTime, UniqueConstraint
+from database import Base
+import gmail_fetch
+
+MAX_STORED_MESSAGES = 200    # 每個帳號最多保留幾封郵件的 metadata
+HIDDEN_LABELS = {"SPAM", "TRASH"}  # messages.list 預設不會列出的郵件
+
+
+class GmailSyncState(Base):
+    __tablename__ = "gmail_sync_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account = Column(String(100), unique=True, index=True)
+    history_id = Column(String(32), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class GmailMessage(Base):
+    __tablename__ = "gmail_messages"
+    __table_args__ = (
+        UniqueConstraint("account", "message_id", name="uq_gmail_message"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    account = Column(String(100), index=True)
+    message_id = Column(String(64))
+    thread_id = Column(String(64), nullable=True)
+    subject = Column(Text)
+    sender = Column(Text)
+    snippet = Column(Text)
+    date = Column(String(100))
+    internal_date = Column(BigInteger, index=True)
+
+
+def row_to_email(row):
+    return {
+        'id': row.message_id,
+        'threadId': row.thread_id,
+        'subject': row.subject,
+        'sender': row.sender,
+        'snippet': row.snippet,
+        'date': row.date,
+    }
+
+
+def _upsert_messages(db, account, messages):
+    existing = {
+        row.message_id: row
+        for row in db.query(GmailMessage).filter(
+            GmailMessage.account == account,
+            GmailMessage.message_id.in_([m['id'] for m in messages])
+        )
+    } if messages else {}
+
+    for msg in messages:
+        if HIDDEN_LABELS & set(msg.get('labelIds', [])):
+            continue
+        email = gmail_fetch.to_email(msg)
+        row = existing.get(msg['id']) or GmailMessage(account=account, message_id=msg['id'])
+        row.thread_id = email['threadId']
+        row.subject = email['subject']
+        row.sender = email['sender']
+        row.snippet = email['snippet']
+        row.date = email['date']
+        row.internal_date = int(msg.get('internalDate') or 0)
+        db.add(row)
+
+
+def _delete_messages(db, account, message_ids):
+    if message_ids:
+        db.query(GmailMessage).filter(
+            GmailMessage.account == account,
+            GmailMessage.message_id.in_(list(message_ids))
+        ).delete(synchronize_session=False)
+
+
+def _prune(db, account):
+    """只保留最新的 MAX_STORED_MESSAGES 封"""
+    cutoff = db.query(GmailMessage.internal_date).filter(
+        GmailMessage.account == account
+    ).order_by(GmailMessage.internal_date.desc()).offset(MAX_STORED_MESSAGES).first()
+    if cutoff:
+        db.query(GmailMessage).filter(
+            GmailMessage.account == account,
+            GmailMessage.internal_date <= cutoff[0]
+        ).delete(synchronize_session=False)
+
+
+def _backfill(db, service, account, max_results):
+    """本機不足 max_results 封時（最新的郵件被刪除 / 移到垃圾桶），補抓最新郵件中本機沒有的"""
+    stored = db.query(GmailMessage).filter(GmailMessage.account == account).count()
+    if stored >= max_results:
+        return 0
+    message_ids = gmail_fetch.list_message_ids(service, max_results=max_results)
+    known = {
+        message_id for (message_id,) in db.query(GmailMessage.message_id).filter(
+            GmailMessage.account == account,
+            GmailMessage.message_id.in_(message_ids)
+        )
+    } if message_ids else set()
+    missing = [message_id for message_id in message_ids if message_id not in known]
+    if missing:
+        _upsert_messages(db, account, gmail_fetch.fetch_messages(service, missing))
+    return len(missing)
+
+
+def full_sync(db, service, account, max_results=20):
+    """完整同步：先記下目前的 historyId，再 list + batch get"""
+    profile = service.users().getProfile(userId='me').execute()
+    message_ids = gmail_fetch.list_message_ids(service, max_results=max_results)
+    messages = gmail_fetch.fetch_messages(service, message_ids)
+
+    db.query(GmailMessage).filter(GmailMessage.account == account).delete(synchronize_session=False)
+    _upsert_messages(db, account, messages)
+
+    state = db.query(GmailSyncState).filter_by(account=account).first() or GmailSyncState(account=account)
+    state.history_id = str(profile['historyId'])
+    state.updated_at = datetime.utcnow()
+    db.add(state)
+    db.commit()
+    print(f"[DEBUG] Gmail 完整同步 {len(messages)} 封，historyId={state.history_id}")
+
+
+def incremental_sync(db, service, account, state, max_results=20):
+    """只抓 historyId 之後的變動；historyId 過期時 Gmail 會回 404"""
+    added, deleted = set(), set()
+    latest_history_id = state.history_id
+    page_token = None
+    while True:
+        kwargs = {
+            'userId': 'me',
+            'startHistoryId': state.history_id,
+            'historyTypes': ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+        }
+        if page_token:
+            kwargs['pageToken'] = page_token
+        response = service.users().history().list(**kwargs).execute()
+
+        # history 依時間排序，後面的紀錄覆蓋前面的
+        for record in response.get('history', []):
+            for item in record.get('messagesAdded', []):
+                added.add(item['message']['id'])
+                deleted.discard(item['message']['id'])
+            for item in record.get('messagesDeleted', []):
+                deleted.add(item['message']['id'])
+                added.discard(item['message']['id'])
+            for item in record.get('labelsAdded', []):
+                if HIDDEN_LABELS & set(item.get('labelIds', [])):
+                    deleted.add(item['message']['id'])
+                    added.discard(item['message']['id'])
+            for item in record.get('labelsRemoved', []):
+                if HIDDEN_LABELS & set(item.get('labelIds', [])):
+                    added.add(item['message']['id'])
+                    deleted.discard(item['message']['id'])
+
+        latest_history_id = response.get('historyId', latest_history_id)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+    if added:
+        _upsert_messages(db, account, gmail_fetch.fetch_messages(service, list(added)))
+    _delete_messages(db, account, deleted)
+    db.flush()
+    backfilled = _backfill(db, service, account, max_results)
+    _prune(db, account)
+
+    state.history_id = str(latest_history_id)
+    state.updated_at = datetime.utcnow()
+    db.commit()
+    print(f"[DEBUG] Gmail 增量同步：新增 {len(added)} 封，移除 {len(deleted)} 封，補抓 {backfilled} 封，historyId={state.history_id}")
+
+
+def sync_messages(db, service, account, max_results=20, force_full=False):
+    """同步後從本機表格回傳最新 max_results 封郵件"""
+    state = db.query(GmailSyncState).filter_by(account=account).first()
+    if state and state.history_id and not force_full:
+        try:
+            incremental_sync(db, service, account, state, max_results)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            db.rollback()
+            print("[DEBUG] Gmail historyId 已過期，改做完整同步")
+            full_sync(db, service, account, max_results)
+    else:
+        full_sync(db, service, account, max_results)
+
+    rows = db.query(GmailMessage).filter(
+        GmailMessage.account == account
+    ).order_by(GmailMessage.internal_date.desc()).limit(max_results).all()
+    return [row_to_email(row) for row in rows]
+
+
+def reset(db, account):
+    """重新授權（可能換了 Google 帳號）時清掉同步狀態"""
+    db.query(GmailSyncState).filter_by(account=account).delete(synchronize_session=False)
+    db.query(GmailMessage).filter(GmailMessage.account == account).delete(synchronize_session=False)
+    db.commit()
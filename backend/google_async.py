@@ -0,0 +1,78 @@
+"""
+Google API 的非同步執行層
+googleapiclient 的 .execute() 是同步的 httplib2 I/O，在 async 路由裡直接呼叫會卡住 event loop，
+所有使用者的請求都要等 Gmail / Calendar 回應。這裡把 Google 呼叫都送到專用、有上限的執行緒池，用 await 等結果：
+- service 在 worker 執行緒裡才透過 Oauth 取得，拿到的是該執行緒自己的連線（httplib2 不是 thread-safe），
+  效果等同 request.execute(http=Oauth.manager.get_http(user_id))，token 過期時的刷新也在 worker 裡做
+- 與 Starlette 預設的 threadpool 分開，Google 變慢時不會佔滿其他同步路由的執行緒
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import Oauth
+
+GMAIL, CALENDAR = "gmail", "calendar"
+WORKERS = int(os.getenv("GOOGLE_API_WORKERS", "32"))
+
+
+class Unauthorized(Exception):
+    """使用者沒有授權這項 Google 服務（或 token 已失效）"""
+
+
+def _service(user_id, name):
+    # 每次都經過 Oauth 的 getter：service 依執行緒快取，測試替換 getter 時也適用
+    return Oauth.get_gmail_service(user_id) if name == GMAIL else Oauth.get_calendar_service(user_id)
+
+
+class GoogleExecutor:
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="google-api")
+            return self._pool
+
+    async def run(self, fn, *args, **kwargs):
+        """在 Google 執行緒池執行 fn(*args, **kwargs)，event loop 不會被卡住"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), functools.partial(fn, *args, **kwargs))
+
+    async def call(self, user_id, name, fn, *args, **kwargs):
+        """在 worker 執行緒取得該使用者的 service 後執行 fn(service, *args, **kwargs)；沒有授權時丟出 Unauthorized"""
+        def work():
+            service = _service(user_id, name)
+            if service is None:
+                raise Unauthorized(f"{name} 未授權")
+            return fn(service, *args, **kwargs)
+        return await self.run(work)
+
+    async def authorized(self, user_id, name):
+        return await self.run(lambda: _service(user_id, name) is not None)
+
+    def shutdown(self):
+        """關閉執行緒池（已送出的呼叫會跑完）；之後再使用時會重新建立"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+executor = GoogleExecutor()
+
+
+async def run(fn, *args, **kwargs):
+    return await executor.run(fn, *args, **kwargs)
+
+
+async def call(user_id, name, fn, *args, **kwargs):
+    return await executor.call(user_id, name, fn, *args, **kwargs)
+
+
+async def authorized(user_id, name):
+    return await executor.authorized(user_id, name)
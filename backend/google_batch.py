@@ -0,0 +1,28 @@
+"""
+Gmail / Calendar 共用的 batch request 工具
+建立 batch（可指定假伺服器的 batch_uri）與判斷個別請求的錯誤能不能重試
+"""
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}   # 限流與伺服器暫時性錯誤
+
+
+def new_batch(service, callback, batch_uri=None):
+    # batch_uri 只有在連到本機假伺服器 (benchmarks.py) 時才需要指定
+    if batch_uri:
+        return BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+    return service.new_batch_http_request(callback=callback)
+
+
+def http_status(exception):
+    """HttpError 的狀態碼；連線 / 逾時等其他錯誤回傳 None"""
+    return exception.resp.status if isinstance(exception, HttpError) else None
+
+
+def is_retryable(exception, transport_errors=False):
+    """429/5xx 可以重試；transport_errors=True 時連線 / 逾時錯誤也重試"""
+    status = http_status(exception)
+    if status is None:
+        return transport_errors
+    return status in RETRYABLE_STATUS
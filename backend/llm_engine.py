@@ -0,0 +1,350 @@
+"""
+非同步 LLM 郵件分類引擎
+- 用 Semaphore 限制同時進行的請求數
+- 每個 (provider, model, api_key) 一個 token bucket，依照各家的每分鐘請求上限放行；
+  最多保留 MAX_BUCKETS 個（LRU），只淘汰閒置已補滿的 bucket，重建後的狀態和原本相同
+- 遇到 429 時依 Retry-After 或指數退避重試
+- classify_stream() 每分析完一封就立刻 yield，不用等整批結束
+- 打包模式：依 token 預算把多封郵件塞進同一個 prompt，回覆 JSON 陣列；解析失敗就對半拆開重試
+- client 由 client_pool 依 (provider, api_key) 共用
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from collections import OrderedDict
+import openai
+import client_pool
+
+DEFAULT_MODELS = {
+    "gemini": "gemini-2.0-flash-exp",
+    "openai": "gpt-3.5-turbo",
+}
+
+# (provider, model) -> (請求數, 每幾秒)；沒列到的 model 用 provider 預設值
+RATE_LIMITS = {
+    ("gemini", "gemini-2.0-flash-exp"): (10, 60),   # Gemini 免費額度每分鐘 10 個請求
+    ("openai", "gpt-3.5-turbo"): (120, 60),
+}
+DEFAULT_RATE_LIMITS = {
+    "gemini": (10, 60),
+    "openai": (60, 60),
+}
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "5"))
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 60.0
+
+# 打包模式：每個 prompt 內郵件部分的 token 預算與封數上限（回覆也要放得下）
+PACK_TOKEN_BUDGET = int(os.getenv("LLM_PACK_TOKEN_BUDGET", "2000"))
+MAX_PACK_SIZE = 20
+
+RESPONSE_FORMAT = """請以JSON格式回覆:
+{
+    "should_add": true/false,
+    "confidence": 0.0-1.0,
+    "suggested_date": "YYYY-MM-DD",
+    "suggested_time": "HH:MM" (如果郵件中沒有明確時間，請設為 null),
+    "reason": "判斷理由"
+}
+"""
+
+PACKED_RESPONSE_FORMAT = """請以JSON陣列格式回覆，每封郵件一個物件，用 id 對應郵件，不要遺漏:
+[
+    {
+        "id": "郵件 id",
+        "should_add": true/false,
+        "confidence": 0.0-1.0,
+        "suggested_date": "YYYY-MM-DD",
+        "suggested_time": "HH:MM" (如果郵件中沒有明確時間，請設為 null),
+        "reason": "判斷理由"
+    }
+]
+"""
+
+_CJK_RE = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓文字大約一字一 token，其他約四個字元一 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def email_text(email):
+    """分析用的郵件內容：有擷取內文時用內文，否則用 snippet"""
+    return email.get('body') or email['snippet']
+
+
+def email_tokens(email):
+    return estimate_tokens(email['subject']) + estimate_tokens(email_text(email)) + 10
+
+
+def build_packs(emails, token_budget=PACK_TOKEN_BUDGET, max_size=MAX_PACK_SIZE):
+    """依 token 預算把郵件分組，超過預算的單封郵件自己一組"""
+    packs, current, used = [], [], 0
+    for email in emails:
+        cost = email_tokens(email)
+        if current and (used + cost > token_budget or len(current) >= max_size):
+            packs.append(current)
+            current, used = [], 0
+        current.append(email)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+class TokenBucket:
+    """簡單的 token bucket，capacity 個請求可以瞬間送出，之後依速率補充"""
+
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+    def drain(self):
+        """收到 429 時清空 bucket，讓後面排隊的請求一起放慢"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+    def idle(self, now):
+        """沒有請求在等、而且閒置到一定補滿了：丟掉之後重建的 bucket 和現在一樣"""
+        return not self._lock.locked() and now - self.updated_at >= max(self.per, BUCKET_IDLE_SECONDS)
+
+
+MAX_BUCKETS = int(os.getenv("LLM_RATE_BUCKETS", "256"))
+BUCKET_IDLE_SECONDS = 600
+
+_buckets = OrderedDict()    # (provider, model, api_key) -> TokenBucket，最近用到的在最後
+
+
+def get_bucket(provider, model, api_key):
+    key = (provider, model, api_key)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        if len(_buckets) >= MAX_BUCKETS:
+            # 從最久沒用的開始淘汰閒置的；還在限流中的 bucket 不能丟，否則等於放寬上限
+            now = time.monotonic()
+            for old_key in [old_key for old_key, old in _buckets.items() if old.idle(now)]:
+                del _buckets[old_key]
+                if len(_buckets) < MAX_BUCKETS:
+                    break
+        rate, per = RATE_LIMITS.get((provider, model), DEFAULT_RATE_LIMITS.get(provider, (60, 60)))
+        bucket = _buckets[key] = TokenBucket(rate, per)
+    _buckets.move_to_end(key)
+    return bucket
+
+
+def resolve_model(model_type, model=None):
+    return model or DEFAULT_MODELS.get(model_type, DEFAULT_MODELS["openai"])
+
+
+def _status_code(error):
+    return getattr(error, "status_code", None) or getattr(error, "code", None)
+
+
+def is_rate_limited(error):
+    return isinstance(error, openai.RateLimitError) or _status_code(error) == 429
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_json_array(content):
+    """從模型回覆中取出 JSON 陣列"""
+    json_match = re.search(r'\[.*\]', content or "", re.DOTALL)
+    if not json_match:
+        raise ValueError("回覆中找不到 JSON 陣列")
+    data = json.loads(json_match.group())
+    if not isinstance(data, list):
+        raise ValueError("回覆不是 JSON 陣列")
+    return data
+
+
+def parse_json_object(content):
+    """從模型回覆中取出 JSON 物件"""
+    json_match = re.search(r'\{.*\}', content or "", re.DOTALL)
+    if not json_match:
+        raise ValueError("回覆中找不到 JSON")
+    return json.loads(json_match.group())
+
+
+class LLMClassifier:
+    def __init__(self, api_key, model_type="gemini", custom_prompt="", model=None,
+                 concurrency=MAX_CONCURRENCY, pack_token_budget=None):
+        self.api_key = api_key
+        self.model_type = model_type
+        self.model = resolve_model(model_type, model)
+        self.custom_prompt = custom_prompt
+        self.pack_token_budget = pack_token_budget  # None 或 0 表示逐封分析
+        self.bucket = get_bucket(model_type, self.model, api_key)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.request_count = 0
+
+    def _client(self):
+        # client 由 client_pool 共用，同一把 key 的請求重複使用既有連線；請求期間借用，不會被淘汰關閉
+        return client_pool.registry.use("gemini" if self.model_type == "gemini" else "openai", self.api_key)
+
+    async def _call(self, system_prompt, user_prompt, temperature):
+        async with self._client() as client:
+            if self.model_type == "gemini":
+                response = await client.aio.models.generate_content(
+                    model=self.model,
+                    contents=f"{system_prompt}\n\n{user_prompt}"
+                )
+                return response.text
+
+            response = await client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=temperature
+            )
+            return response.choices[0].message.content
+
+    async def complete(self, system_prompt, user_prompt, temperature=0.3):
+        """送出一個請求（受併發數與速率限制），429 時退避重試"""
+        for attempt in range(MAX_RETRIES + 1):
+            async with self.semaphore:
+                await self.bucket.acquire()
+                try:
+                    self.request_count += 1
+                    return await self._call(system_prompt, user_prompt, temperature)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == MAX_RETRIES:
+                        raise
+                    self.bucket.drain()
+                    delay = _retry_after(e) or min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+                    delay += random.uniform(0, 1)
+
+            # 退避時不佔用併發名額
+            print(f"[DEBUG] {self.model_type} 限流 (429)，{delay:.1f} 秒後重試 ({attempt + 1}/{MAX_RETRIES})")
+            await asyncio.sleep(delay)
+
+    def build_prompt(self, email):
+        return f"""
+請分析以下郵件:
+主旨: {email['subject']}
+內容: {email_text(email)}
+
+{RESPONSE_FORMAT}"""
+
+    async def classify(self, email):
+        content = await self.complete(self.custom_prompt, self.build_prompt(email))
+        return parse_json_object(content)
+
+    def build_packed_prompt(self, pack):
+        items = "\n".join(
+            f"[{i}] id: {email['id']}\n主旨: {email['subject']}\n內容: {email_text(email)}\n"
+            for i, email in enumerate(pack, 1)
+        )
+        return f"""
+請分析以下 {len(pack)} 封郵件，每封都要回覆一筆結果:
+
+{items}
+{PACKED_RESPONSE_FORMAT}"""
+
+    async def classify_pack(self, pack):
+        """一個請求分析多封郵件，回傳 [(email, analysis, error)]"""
+        if len(pack) == 1:
+            return [await self._classify_safe(pack[0])]
+
+        try:
+            content = await self.complete(self.custom_prompt, self.build_packed_prompt(pack))
+            verdicts = parse_json_array(content)
+        except Exception as e:
+            if is_rate_limited(e):
+                return [(email, None, e) for email in pack]
+            print(f"[DEBUG] {len(pack)} 封打包回覆解析失敗 ({e})，拆半重試")
+            return await self._split_and_retry(pack)
+
+        # 只用 id 對應；回覆漏掉或順序不同時不能拿位置猜，否則會套到隔壁郵件的判斷
+        by_id = {}
+        for verdict in verdicts:
+            if isinstance(verdict, dict) and verdict.get('id') is not None:
+                by_id.setdefault(str(verdict['id']).strip(), verdict)
+
+        results, missing = [], []
+        for email in pack:
+            verdict = by_id.get(email['id'])
+            if verdict is None:
+                missing.append(email)
+            else:
+                results.append((email, verdict, None))
+
+        if missing:
+            print(f"[DEBUG] 打包回覆漏掉 {len(missing)} 封，重新分析")
+            if len(missing) == len(pack):
+                results.extend(await self._split_and_retry(pack))
+            else:
+                results.extend(await self.classify_pack(missing))
+        return results
+
+    async def _split_and_retry(self, pack):
+        middle = len(pack) // 2
+        left, right = await asyncio.gather(
+            self.classify_pack(pack[:middle]),
+            self.classify_pack(pack[middle:])
+        )
+        return left + right
+
+    async def _classify_safe(self, email):
+        try:
+            return email, await self.classify(email), None
+        except Exception as e:
+            return email, None, e
+
+    async def _classify_pack_safe(self, pack):
+        try:
+            return await self.classify_pack(pack)
+        except Exception as e:
+            return [(email, None, e) for email in pack]
+
+    async def classify_stream(self, emails):
+        """並行分析，依完成順序 yield (email, analysis, error)"""
+        if self.pack_token_budget:
+            packs = build_packs(emails, self.pack_token_budget)
+            print(f"[DEBUG] {len(emails)} 封郵件打包成 {len(packs)} 個請求")
+            tasks = [asyncio.create_task(self._classify_pack_safe(pack)) for pack in packs]
+        else:
+            tasks = [asyncio.create_task(self._classify_safe(email)) for email in emails]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if isinstance(result, list):
+                    for item in result:
+                        yield item
+                else:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
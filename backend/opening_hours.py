@@ -0,0 +1,133 @@
+"""
+餐廳營業時間索引
+啟動時把 openingHours 編譯成「一週第幾分鐘」(0 = 週日 00:00) 的區間：每家餐廳一份排序好的區間，
+全部餐廳再合成一條時間軸，每一段記錄當時營業中餐廳的 bitmask。
+查詢「某個時間有開」只要一次 bisect，「N 分鐘內會開」則是把時間窗內各段的 bitmask 做 OR
+"""
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+TAIPEI = timezone(timedelta(hours=8))
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def parse_minute(value):
+    """'HH:MM' -> 當天第幾分鐘（'24:00' 為 1440）"""
+    hour, minute = value.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def minute_of_week(dt=None):
+    """台北時間的一週第幾分鐘；openingHours 的 days 以 0 代表週日"""
+    if dt is None:
+        dt = datetime.now(TAIPEI)
+    elif dt.tzinfo is None:
+        dt = dt.replace(tzinfo=TAIPEI)
+    dt = dt.astimezone(TAIPEI)
+    day = (dt.weekday() + 1) % 7
+    return day * MINUTES_PER_DAY + dt.hour * 60 + dt.minute
+
+
+def compile_hours(opening_hours):
+    """
+    回傳合併後、依開始時間排序的 [start, end) 區間（一週第幾分鐘）。
+    與原本的 is_open 相同，結束時間那一分鐘仍算營業中；
+    跨日的時段（例如 20:00-02:00）切成當天到午夜、隔天凌晨兩段，週六跨到週日
+    """
+    intervals = []
+    for schedule in opening_hours:
+        for day in schedule["days"]:
+            base = day * MINUTES_PER_DAY
+            for slot in schedule["slots"]:
+                start, end = parse_minute(slot["start"]), parse_minute(slot["end"])
+                if start <= end:
+                    intervals.append((base + start, base + min(end + 1, MINUTES_PER_DAY)))
+                else:
+                    intervals.append((base + start, base + MINUTES_PER_DAY))
+                    next_base = (day + 1) % 7 * MINUTES_PER_DAY
+                    intervals.append((next_base, next_base + end + 1))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+class OpeningHoursIndex:
+    def __init__(self, restaurants):
+        self.restaurants = list(restaurants)
+        self.intervals = [compile_hours(r.get("openingHours", [])) for r in self.restaurants]
+
+        # 每家餐廳的區間互不重疊，所以在開始、結束的時間點把該餐廳的 bit 翻轉即可
+        toggles = {}
+        for position, intervals in enumerate(self.intervals):
+            for start, end in intervals:
+                toggles[start] = toggles.get(start, 0) ^ (1 << position)
+                toggles[end] = toggles.get(end, 0) ^ (1 << position)
+
+        self._bounds = [0]      # 每一段的開始分鐘
+        self._masks = [0]       # 該段營業中餐廳的 bitmask（bit i = self.restaurants[i]）
+        mask = 0
+        for minute in sorted(toggles):
+            mask ^= toggles[minute]
+            if minute == self._bounds[-1]:
+                self._masks[-1] = mask
+            elif minute < MINUTES_PER_WEEK:
+                self._bounds.append(minute)
+                self._masks.append(mask)
+
+    def _segment(self, minute):
+        return bisect_right(self._bounds, minute) - 1
+
+    def open_mask(self, minute):
+        return self._masks[self._segment(minute % MINUTES_PER_WEEK)]
+
+    def mask_between(self, start, end):
+        """[start, end) 之間任何時刻有營業的餐廳，可以跨過週六午夜"""
+        mask = 0
+        end = min(end, start + MINUTES_PER_WEEK)
+        minute = start
+        while minute < end:
+            offset = minute % MINUTES_PER_WEEK
+            i = self._segment(offset)
+            mask |= self._masks[i]
+            next_bound = self._bounds[i + 1] if i + 1 < len(self._bounds) else MINUTES_PER_WEEK
+            minute += next_bound - offset
+        return mask
+
+    def opening_mask(self, minute, within):
+        """目前沒開、但接下來 within 分鐘內會開的餐廳"""
+        return self.mask_between(minute + 1, minute + within + 1) & ~self.open_mask(minute)
+
+    def members(self, mask):
+        found = []
+        while mask:
+            low = mask & -mask
+            found.append(self.restaurants[low.bit_length() - 1])
+            mask ^= low
+        return found
+
+    def open_at(self, dt=None):
+        """dt 時營業中的餐廳（預設現在）"""
+        return self.members(self.open_mask(minute_of_week(dt)))
+
+    def opening_within(self, minutes, dt=None):
+        """dt 時還沒開、minutes 分鐘內會開的餐廳"""
+        return self.members(self.opening_mask(minute_of_week(dt), minutes))
+
+    def minutes_until_open(self, position, dt=None):
+        """第 position 家餐廳距離下次開門還有幾分鐘（營業中為 0，沒有營業時間為 None）"""
+        intervals = self.intervals[position]
+        if not intervals:
+            return None
+        minute = minute_of_week(dt)
+        for start, end in intervals:
+            if start <= minute < end:
+                return 0
+            if start > minute:
+                return start - minute
+        return intervals[0][0] + MINUTES_PER_WEEK - minute
@@ -0,0 +1,290 @@
+"""
+LLM 之前的本機預先分類
+1. 關鍵字：add / remove 兩組關鍵字建成一個 Aho–Corasick 自動機，每封郵件只掃一次（不分大小寫，移除優先）
+2. 本機模型：字元 n-gram 與英數單字雜湊成固定維度的特徵，logistic regression 用這位使用者、
+   這個 prompt 過去的 LLM 判斷訓練；保留一部分資料驗證，夠準才啟用，機率夠極端的郵件直接決定
+剩下判斷不了的才送 LLM；counters 累計各層處理的郵件數（= 省下的 LLM 呼叫）
+"""
+import asyncio
+import hashlib
+import math
+import random
+import re
+import zlib
+from collections import Counter, deque
+from datetime import datetime
+from functools import lru_cache
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, UniqueConstraint, func
+from database import Base
+
+ADD, REMOVE = "add", "remove"
+
+N_FEATURES = 1 << 18
+MIN_SAMPLES = 40            # 同一個 (使用者, prompt) 至少要有這麼多筆判斷才訓練
+MAX_SAMPLES = 2000          # 只用最近的這麼多筆
+RETRAIN_EVERY = 20          # 新增這麼多筆判斷後重新訓練
+EPOCHS = 8
+LEARNING_RATE = 0.3
+L2 = 1e-5
+HOLDOUT = 0.2
+ACCEPT_PROBA = 0.9          # 機率 >= 這個值直接加入，<= REJECT_PROBA 直接移除
+REJECT_PROBA = 0.1
+MIN_PRECISION = 0.95        # 驗證資料上有把握的判斷至少要這麼準才啟用
+MIN_CONFIDENT = 5
+MAX_TEXT_CHARS = 2000
+DATE_CONFIDENCE = 0.8       # 模型判斷要加入時，日期擷取的信心也要到這個值才不問 LLM
+LOCAL_TIERS = ("keyword_removed", "keyword_added", "model_rejected", "model_accepted")
+
+_CJK_RUN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]+')
+_WORD_RE = re.compile(r'[a-z0-9]+(?:[.\'][a-z0-9]+)*')
+
+# 程序啟動以來各層處理的郵件數
+counters = Counter()
+
+
+class ClassifierSample(Base):
+    __tablename__ = "classifier_samples"
+    __table_args__ = (
+        UniqueConstraint("user_id", "prompt_hash", "message_id", name="uq_classifier_sample"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    prompt_hash = Column(String(64), index=True)
+    message_id = Column(String(64))
+    text = Column(Text)
+    label = Column(Boolean)         # LLM 判斷要加入行事曆
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class AhoCorasick:
+    """多個關鍵字同時比對，掃一次文字就找出所有出現的關鍵字"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                child = self.goto[node].get(ch)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][ch] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                node = child
+            self.out[node] += (index,)
+
+        # BFS 建 failure link，輸出沿著 failure link 合併
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                self.out[child] += self.out[self.fail[child]]
+
+    def iter_matches(self, text):
+        """依序產生 (結束位置, 關鍵字 index)"""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in out[node]:
+                yield pos, index
+
+
+class KeywordMatcher:
+    def __init__(self, add_keywords=(), remove_keywords=()):
+        self.keywords = [(kw, REMOVE) for kw in remove_keywords if kw] + [(kw, ADD) for kw in add_keywords if kw]
+        self.automaton = AhoCorasick([kw.lower() for kw, _ in self.keywords])
+
+    def match(self, text):
+        """回傳 (ADD / REMOVE / None, 關鍵字)；同時出現時移除優先"""
+        found = (None, None)
+        if not self.keywords:
+            return found
+        for _, index in self.automaton.iter_matches(text.lower()):
+            keyword, action = self.keywords[index]
+            if action == REMOVE:
+                return action, keyword
+            if found[0] is None:
+                found = (action, keyword)
+        return found
+
+
+@lru_cache(maxsize=128)
+def _matcher(add_keywords, remove_keywords):
+    return KeywordMatcher(add_keywords, remove_keywords)
+
+
+def keyword_matcher(add_keywords, remove_keywords):
+    """同一組關鍵字重複使用已建好的自動機"""
+    return _matcher(tuple(add_keywords or ()), tuple(remove_keywords or ()))
+
+
+def _bucket(token):
+    return zlib.crc32(token.encode('utf-8')) & (N_FEATURES - 1)
+
+
+def features(text):
+    """中日韓文字取 1~3 字元 n-gram、其他取英數單字，雜湊到 N_FEATURES 維；回傳 L2 正規化的 {index: 值}"""
+    text = text[:MAX_TEXT_CHARS].lower()
+    counts = Counter()
+    for word in _WORD_RE.findall(text):
+        counts[_bucket('w:' + word)] += 1
+    for run in _CJK_RUN_RE.findall(text):
+        for n in (1, 2, 3):
+            for i in range(len(run) - n + 1):
+                counts[_bucket(run[i:i + n])] += 1
+    if not counts:
+        return {}
+    values = {index: math.log1p(count) for index, count in counts.items()}
+    norm = math.sqrt(sum(v * v for v in values.values()))
+    return {index: v / norm for index, v in values.items()}
+
+
+def _sigmoid(z):
+    if z < -30:
+        return 0.0
+    if z > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+class HashedLogisticRegression:
+    def __init__(self):
+        self.weights = {}
+        self.bias = 0.0
+
+    def predict_proba(self, feats):
+        weights = self.weights
+        return _sigmoid(self.bias + sum(weights.get(i, 0.0) * v for i, v in feats.items()))
+
+    def fit(self, samples, epochs=EPOCHS, learning_rate=LEARNING_RATE, l2=L2, seed=0):
+        """samples: [(features, label)]，SGD，學習率隨 epoch 遞減"""
+        rng = random.Random(seed)
+        order = list(range(len(samples)))
+        weights = self.weights
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            rate = learning_rate / (1 + epoch)
+            for i in order:
+                feats, label = samples[i]
+                gradient = self.predict_proba(feats) - (1.0 if label else 0.0)
+                for index, value in feats.items():
+                    w = weights.get(index, 0.0)
+                    weights[index] = w - rate * (gradient * value + l2 * w)
+                self.bias -= rate * gradient
+        return self
+
+
+class LocalModel:
+    """訓練好的模型加上驗證結果；decide() 回傳 True / False（有把握）或 None（交給 LLM）"""
+
+    def __init__(self, model, samples, precision, coverage):
+        self.model = model
+        self.samples = samples
+        self.precision = precision
+        self.coverage = coverage
+
+    def decide(self, text):
+        proba = self.model.predict_proba(features(text))
+        if proba >= ACCEPT_PROBA:
+            return True, proba
+        if proba <= REJECT_PROBA:
+            return False, proba
+        return None, proba
+
+    def info(self):
+        return {"samples": self.samples, "precision": round(self.precision, 3), "coverage": round(self.coverage, 3)}
+
+
+def train_local_model(samples):
+    """
+    samples: [(text, label)]。依 hash 切出驗證資料，驗證資料上有把握的判斷夠多且夠準時，
+    用全部資料重新訓練並回傳 LocalModel，否則回傳 None
+    """
+    labels = {label for _, label in samples}
+    if len(samples) < MIN_SAMPLES or len(labels) < 2:
+        return None
+    vectors = [(features(text), label) for text, label in samples]
+    holdout = [i for i, (text, _) in enumerate(samples) if zlib.crc32(text.encode('utf-8')) % 100 < HOLDOUT * 100]
+    held = set(holdout)
+    model = HashedLogisticRegression().fit([v for i, v in enumerate(vectors) if i not in held])
+
+    confident = correct = 0
+    for i in holdout:
+        feats, label = vectors[i]
+        proba = model.predict_proba(feats)
+        if proba >= ACCEPT_PROBA or proba <= REJECT_PROBA:
+            confident += 1
+            correct += (proba >= ACCEPT_PROBA) == label
+    precision = correct / confident if confident else 0.0
+    if confident < MIN_CONFIDENT or precision < MIN_PRECISION:
+        print(f"[DEBUG] 本機模型驗證未通過（有把握 {confident}/{len(holdout)} 封，準確率 {precision:.2f}），不啟用")
+        return None
+    return LocalModel(HashedLogisticRegression().fit(vectors), len(samples), precision, confident / len(holdout))
+
+
+def calls_saved(stats):
+    """本機就決定、不用送 LLM 的郵件數"""
+    return sum(stats[tier] for tier in LOCAL_TIERS)
+
+
+def prompt_hash(custom_prompt):
+    return hashlib.sha256((custom_prompt or "").encode("utf-8")).hexdigest()
+
+
+def record(db, user_id, email, text, label, custom_prompt):
+    """記下一筆 LLM 判斷當作訓練資料（同一封郵件覆蓋舊的判斷）"""
+    key = {"user_id": user_id, "prompt_hash": prompt_hash(custom_prompt), "message_id": email['id']}
+    try:
+        row = db.query(ClassifierSample).filter_by(**key).first()
+        if row is None:
+            row = ClassifierSample(**key)
+            db.add(row)
+        row.text = text[:MAX_TEXT_CHARS]
+        row.label = bool(label)
+        row.created_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] 寫入本機模型訓練資料失敗 ({email['id']}): {e}")
+
+
+class ModelStore:
+    """每個 (使用者, prompt) 一個模型，放在記憶體；訓練資料增加 RETRAIN_EVERY 筆以上才重新訓練"""
+
+    def __init__(self):
+        self._models = {}       # key -> (訓練時的資料筆數, LocalModel 或 None)
+
+    async def get(self, db, user_id, custom_prompt):
+        key = (user_id, prompt_hash(custom_prompt))
+        filters = (ClassifierSample.user_id == user_id, ClassifierSample.prompt_hash == key[1])
+        # 資料庫查詢與訓練（純 CPU 計算）都丟到 thread，不要卡住 event loop
+        count = await asyncio.to_thread(lambda: db.query(func.count(ClassifierSample.id)).filter(*filters).scalar())
+        cached = self._models.get(key)
+        if cached and count - cached[0] < RETRAIN_EVERY:
+            return cached[1]
+        if count < MIN_SAMPLES:
+            return None
+
+        rows = await asyncio.to_thread(lambda: db.query(ClassifierSample.text, ClassifierSample.label).filter(*filters)
+                                       .order_by(ClassifierSample.created_at.desc()).limit(MAX_SAMPLES).all())
+        model = await asyncio.to_thread(train_local_model, [(text, label) for text, label in rows])
+        self._models[key] = (count, model)
+        if model:
+            print(f"[DEBUG] 本機模型已更新 (user {user_id}): {model.info()}")
+        return model
+
+
+models = ModelStore()
@@ -0,0 +1,159 @@
+"""
+餐廳目錄
+啟動時建好一次：依地點（以及 cuisine / price / tags 等欄位）建立反向索引，
+每個值對應一個 bitmask（bit i = 第 i 家餐廳），篩選就是 bitmask 的 OR / AND，
+與營業時間索引 (opening_hours) 的結果可以直接相交。
+抽籤使用 alias method：每組候選名單建表 O(k) 並快取，之後每次抽選 O(1)
+"""
+import random
+import threading
+from collections import OrderedDict, deque
+import opening_hours
+
+INDEXED_FIELDS = ("location", "cuisine", "price")   # 單一值的欄位
+TAG_FIELD = "tags"                                   # 多值的欄位 (list)
+DEFAULT_WEIGHT = 1.0
+ALIAS_CACHE_SIZE = 128
+RECENT_SIZE = 5          # 「避開最近抽過」記住幾家
+MAX_RECENT_CLIENTS = 1024
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class AliasTable:
+    """Walker alias method：依權重抽出 positions 其中一個"""
+
+    def __init__(self, positions, weights):
+        n = len(positions)
+        total = sum(weights)
+        if total <= 0:
+            weights, total = [1.0] * n, float(n)
+        scaled = [w * n / total for w in weights]
+        self.positions = positions
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def sample(self, rng=random):
+        i = rng.randrange(len(self.positions))
+        return self.positions[i if rng.random() < self.prob[i] else self.alias[i]]
+
+
+class RestaurantCatalog:
+    def __init__(self, restaurants):
+        self.restaurants = list(restaurants)
+        self.all_mask = (1 << len(self.restaurants)) - 1
+        self.opening = opening_hours.OpeningHoursIndex(self.restaurants)
+        self.weights = [max(float(r.get("weight", DEFAULT_WEIGHT)), 0.0) for r in self.restaurants]
+        self._positions = {r["id"]: i for i, r in enumerate(self.restaurants)}
+
+        # 欄位 -> 值 -> bitmask
+        self._index = {field: {} for field in INDEXED_FIELDS + (TAG_FIELD,)}
+        for position, restaurant in enumerate(self.restaurants):
+            bit = 1 << position
+            for field in INDEXED_FIELDS:
+                value = restaurant.get(field)
+                if value is not None:
+                    self._index[field][value] = self._index[field].get(value, 0) | bit
+            for tag in restaurant.get(TAG_FIELD, []):
+                self._index[TAG_FIELD][tag] = self._index[TAG_FIELD].get(tag, 0) | bit
+
+        self._alias_cache = OrderedDict()   # mask -> AliasTable
+        self._alias_lock = threading.Lock()
+
+    def values(self, field):
+        return sorted(self._index[field])
+
+    def match(self, tags=(), **filters):
+        """
+        filters: 欄位=值的清單，同一欄位內是 OR、不同欄位之間是 AND，例如 match(location=["後門", "宵夜街"])；
+        tags 則是每個都要有。沒有指定的欄位不限制
+        """
+        mask = self.all_mask
+        for field, values in filters.items():
+            index = self._index[field]
+            field_mask = 0
+            for value in values:
+                field_mask |= index.get(value, 0)
+            mask &= field_mask
+        for tag in tags:
+            mask &= self._index[TAG_FIELD].get(tag, 0)
+        return mask
+
+    def open_mask(self, dt=None, opens_within=0):
+        """dt 時營業中（加上 opens_within 分鐘內開門）的餐廳"""
+        minute = opening_hours.minute_of_week(dt)
+        mask = self.opening.open_mask(minute)
+        if opens_within:
+            mask |= self.opening.opening_mask(minute, opens_within)
+        return mask
+
+    def ids_mask(self, ids):
+        mask = 0
+        for restaurant_id in ids:
+            if restaurant_id in self._positions:
+                mask |= 1 << self._positions[restaurant_id]
+        return mask
+
+    def members(self, mask):
+        return [self.restaurants[i] for i in _bits(mask)]
+
+    def _alias_table(self, mask):
+        with self._alias_lock:
+            table = self._alias_cache.get(mask)
+            if table is not None:
+                self._alias_cache.move_to_end(mask)
+                return table
+
+        positions = list(_bits(mask))
+        table = AliasTable(positions, [self.weights[i] for i in positions])
+        with self._alias_lock:
+            self._alias_cache[mask] = table
+            while len(self._alias_cache) > ALIAS_CACHE_SIZE:
+                self._alias_cache.popitem(last=False)
+        return table
+
+    def sample(self, mask, avoid=0, rng=random):
+        """依權重抽一家，回傳位置；avoid 裡的餐廳盡量不抽（全部都在 avoid 裡就不管）。沒有候選回傳 None"""
+        if mask & ~avoid:
+            mask &= ~avoid
+        if not mask:
+            return None
+        return self._alias_table(mask).sample(rng)
+
+
+class RecentPicks:
+    """每個使用者（以 client 位址區分）最近抽到的餐廳，給「避開最近抽過」用"""
+
+    def __init__(self, size=RECENT_SIZE, max_clients=MAX_RECENT_CLIENTS):
+        self.size = size
+        self.max_clients = max_clients
+        self._clients = OrderedDict()   # client -> deque[restaurant id]
+        self._lock = threading.Lock()
+
+    def ids(self, client):
+        with self._lock:
+            return set(self._clients.get(client, ()))
+
+    def add(self, client, restaurant_id):
+        with self._lock:
+            picks = self._clients.get(client)
+            if picks is None:
+                picks = self._clients[client] = deque(maxlen=self.size)
+            picks.append(restaurant_id)
+            self._clients.move_to_end(client)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
@@ -0,0 +1,137 @@
+"""
+LLM 判斷結果快取
+key = (使用者, message id, 主旨+摘要（或內文）hash, custom_prompt hash, model_type, model)
+同一位使用者的同一封郵件內容與 prompt 都沒變時直接沿用上次的判斷，不再呼叫 LLM；不同使用者之間不共用
+"""
+import os
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import Column, Integer, String, Boolean, Float, Text, DateTime, ForeignKey, UniqueConstraint
+from database import Base
+
+VERDICT_CACHE_TTL = timedelta(days=int(os.getenv("VERDICT_CACHE_TTL_DAYS", "7")))
+EVICT_BATCH = 500
+
+
+class LLMVerdict(Base):
+    # 舊的 llm_verdicts 沒有 user_id、各使用者共用；快取可以重建，換新表不做搬移
+    __tablename__ = "user_llm_verdicts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "message_id", "content_hash", "prompt_hash", "model_type", "model", name="uq_user_llm_verdict_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    message_id = Column(String(64), index=True)
+    content_hash = Column(String(64))
+    prompt_hash = Column(String(64))
+    model_type = Column(String(20))
+    model = Column(String(100))
+
+    should_add = Column(Boolean, default=False)
+    confidence = Column(Float, default=0)
+    suggested_date = Column(String(10), nullable=True)
+    suggested_time = Column(String(5), nullable=True)
+    reason = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+def _hash(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def content_hash(email):
+    return _hash(email['subject'] + "\n" + (email.get('body') or email['snippet']))
+
+
+def _clean(value):
+    return None if value in (None, "", "null") else str(value)
+
+
+def get_many(db, user_id, emails, custom_prompt, model_type, model):
+    """回傳 {message_id: analysis}，只包含這位使用者未過期且內容沒變的結果"""
+    if not emails:
+        return {}
+    hashes = {email['id']: content_hash(email) for email in emails}
+    rows = db.query(LLMVerdict).filter(
+        LLMVerdict.user_id == user_id,
+        LLMVerdict.message_id.in_(list(hashes)),
+        LLMVerdict.prompt_hash == _hash(custom_prompt),
+        LLMVerdict.model_type == model_type,
+        LLMVerdict.model == model,
+        LLMVerdict.created_at >= datetime.utcnow() - VERDICT_CACHE_TTL,
+    ).all()
+
+    cached = {}
+    for row in rows:
+        if hashes.get(row.message_id) == row.content_hash:
+            cached[row.message_id] = {
+                "should_add": row.should_add,
+                "confidence": row.confidence,
+                "suggested_date": row.suggested_date,
+                "suggested_time": row.suggested_time,
+                "reason": row.reason,
+            }
+    return cached
+
+
+def put(db, user_id, email, analysis, custom_prompt, model_type, model):
+    """寫入（或覆蓋）一筆判斷結果"""
+    key = {
+        "user_id": user_id,
+        "message_id": email['id'],
+        "content_hash": content_hash(email),
+        "prompt_hash": _hash(custom_prompt),
+        "model_type": model_type,
+        "model": model,
+    }
+    try:
+        confidence = float(analysis.get('confidence') or 0)
+    except (TypeError, ValueError):
+        confidence = 0.0
+    values = {
+        "should_add": bool(analysis.get('should_add')),
+        "confidence": confidence,
+        "suggested_date": (_clean(analysis.get('suggested_date')) or "")[:10] or None,
+        "suggested_time": (_clean(analysis.get('suggested_time')) or "")[:5] or None,
+        "reason": _clean(analysis.get('reason')),
+        "created_at": datetime.utcnow(),
+    }
+    try:
+        row = db.query(LLMVerdict).filter_by(**key).first()
+        if row:
+            for name, value in values.items():
+                setattr(row, name, value)
+        else:
+            db.add(LLMVerdict(**key, **values))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] 寫入判斷快取失敗 ({email['id']}): {e}")
+
+
+def evict_expired(db, now=None):
+    """分批刪除超過 TTL 的結果（背景工作每分鐘檢查時呼叫），回傳刪除筆數"""
+    cutoff = (now or datetime.utcnow()) - VERDICT_CACHE_TTL
+    deleted = 0
+    while True:
+        ids = [verdict_id for (verdict_id,) in db.query(LLMVerdict.id).filter(
+            LLMVerdict.created_at < cutoff
+        ).limit(EVICT_BATCH).all()]
+        if not ids:
+            return deleted
+        db.query(LLMVerdict).filter(LLMVerdict.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+
+
+def invalidate(db, user_id, message_ids=None, model_type=None):
+    """清除這位使用者的快取：可指定郵件 id 或模型種類，都不指定就清除這位使用者的全部"""
+    query = db.query(LLMVerdict).filter(LLMVerdict.user_id == user_id)
+    if message_ids:
+        query = query.filter(LLMVerdict.message_id.in_(message_ids))
+    if model_type:
+        query = query.filter(LLMVerdict.model_type == model_type)
+    deleted = query.delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,101 @@
+"""
+氣象資料快取
+座標依 WEATHER_GRID_DEG 切成格子，同一格在 TTL 內共用一份 open-meteo 的結果；
+同一格同時有多個請求未命中時只會發出一次外部請求。
+資料過期但還在 MAX_STALE_SECONDS 內時先回舊資料、在背景更新 (stale-while-revalidate)，
+外部 API 失敗時也用舊資料頂著
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+import client_pool
+
+API_URL = "https://api.open-meteo.com/v1/forecast"
+GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", "0.05"))           # 約 5 公里
+TTL_SECONDS = int(os.getenv("WEATHER_TTL_SECONDS", "600"))
+MAX_STALE_SECONDS = int(os.getenv("WEATHER_MAX_STALE_SECONDS", "21600"))
+MAX_BUCKETS = 1024
+TIMEOUT = 10.0
+
+_cache = OrderedDict()   # bucket -> (fetched_at, data)
+_inflight = {}           # bucket -> asyncio.Task
+
+
+def get_client():
+    """整個程序共用的 AsyncClient（由 client_pool 管理，保持連線不用每次重新 TLS 握手）"""
+    return client_pool.registry.http("weather", timeout=TIMEOUT)
+
+
+def bucket_of(lat, lon):
+    return round(lat / GRID_DEG), round(lon / GRID_DEG)
+
+
+def describe(wmo_code):
+    status = "晴天"
+    if wmo_code > 3: status = "多雲"
+    if wmo_code > 50: status = "有雨"
+    if wmo_code > 80: status = "雷雨"
+    if wmo_code > 95: status = "下雪"
+    return status
+
+
+async def _fetch(bucket):
+    # 用格子中心查詢，同一格的快取內容才會一致
+    params = {
+        "latitude": round(bucket[0] * GRID_DEG, 4),
+        "longitude": round(bucket[1] * GRID_DEG, 4),
+        "current": "temperature_2m,weather_code",
+        "timezone": "auto",
+    }
+    response = await get_client().get(API_URL, params=params)
+    print(f"外部 API 回應狀態: {response.status_code}")
+    response.raise_for_status()
+    current = response.json()["current"]
+    return {"temperature": current["temperature_2m"], "weather_code": current["weather_code"]}
+
+
+async def _update(bucket):
+    try:
+        data = await _fetch(bucket)
+        _cache[bucket] = (time.monotonic(), data)
+        _cache.move_to_end(bucket)
+        while len(_cache) > MAX_BUCKETS:
+            _cache.popitem(last=False)
+        return data
+    finally:
+        _inflight.pop(bucket, None)
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[ERROR] 氣象資料更新失敗: {task.exception()}")
+
+
+def _refresh(bucket):
+    task = _inflight.get(bucket)
+    if task is None:
+        task = _inflight[bucket] = asyncio.ensure_future(_update(bucket))
+        task.add_done_callback(_log_failure)
+    return task
+
+
+async def get_current(lat, lon):
+    """回傳 (data, stale)；沒有任何可用資料時丟出外部 API 的例外"""
+    bucket = bucket_of(lat, lon)
+    entry = _cache.get(bucket)
+    age = time.monotonic() - entry[0] if entry else None
+    if entry and age < TTL_SECONDS:
+        return entry[1], False
+
+    task = _refresh(bucket)
+    if entry and age < MAX_STALE_SECONDS:
+        return entry[1], True
+
+    try:
+        # shield：某個請求斷線時不要取消其他請求也在等的更新
+        return await asyncio.shield(task), False
+    except Exception:
+        if entry:
+            return entry[1], True
+        raise
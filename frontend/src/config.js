@@ -1,2 +1,5 @@
 export const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 export const API_BASE = `${API_URL}/api`;
+
+// 需要登入的 API 都帶上 JWT（Google 授權依使用者分開存放）
+export const authHeaders = () => ({ Authorization: `Bearer ${localStorage.getItem('token')}` });